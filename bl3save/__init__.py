@@ -3008,3 +3008,49 @@ fts_to_map = {
         '/game/patchdlc/takedown2/gamedata/leveltravel/lts_sanctuary3_td2.lts_sanctuary3_td2': 'Sanctuary3_P',
         }
 
+
+# How much of the payload `get_file_class` decrypts, when the header alone
+# isn't enough to tell what kind of file it's looking at.
+_probe_len = 512
+
+def get_file_class(filename):
+    """
+    Figures out whether `filename` is a savegame or a profile, returning
+    either the `BL3Save` or `BL3Profile` class, without having to decrypt
+    and parse the whole file.  The `sg_type` in the GVAS header is usually
+    enough to go on, but if it doesn't look familiar, we'll decrypt the
+    start of the payload with each file type's magic values and see which
+    one produces something resembling that type's protobuf message.
+    """
+    # Imported here because setup.py imports this module just to find
+    # `__version__`, before any dependencies are installed.
+    from . import gvas, protowire
+    from .bl3save import BL3Save
+    from .bl3profile import BL3Profile
+    classes = [BL3Save, BL3Profile]
+
+    header = gvas.read_header(filename)
+    if header.sg_type:
+        for cls in classes:
+            if cls._sg_type_marker in header.sg_type:
+                return cls
+
+    (header, prefixes) = gvas.read_prefix(filename, [cls._codec for cls in classes], _probe_len)
+    best_cls = None
+    best_count = 0
+    for cls, prefix in zip(classes, prefixes):
+        count = protowire.count_matching_fields(prefix, cls._protobuf_class.DESCRIPTOR)
+        if count is not None and count > best_count:
+            best_cls = cls
+            best_count = count
+    if best_cls is None:
+        raise Exception('Unable to determine whether {} is a savegame or a profile'.format(filename))
+    return best_cls
+
+def open_any(filename, *args, **kwargs):
+    """
+    Opens `filename` as either a `BL3Save` or `BL3Profile` object, whichever
+    it turns out to be (see `get_file_class`).  Any other arguments are passed
+    along to the constructor.
+    """
+    return get_file_class(filename)(filename, *args, **kwargs)
@@ -21,18 +21,19 @@
 # 
 # 3. This notice may not be removed or altered from any source distribution.
 
-# The encryption/decryption stanzas in BL3Profile.__init__
-# were helpfully provided by Gibbed (rick 'at' gibbed 'dot' us), so many
-# thanks for that!  https://gist.github.com/gibbed/b6a93f74c575ce99b42c3b629ac1856a
+# The encryption/decryption scheme used by BL3Profile.__init__ (which now lives
+# in gvas.PayloadCodec) was helpfully provided by Gibbed (rick 'at' gibbed 'dot' us),
+# so many thanks for that!  https://gist.github.com/gibbed/b6a93f74c575ce99b42c3b629ac1856a
 #
 # The rest of the savegame format was gleaned from 13xforever/Ilya's
 # "gvas-converter" project: https://github.com/13xforever/gvas-converter
 
 import base64
-import struct
+import json
 import google.protobuf
 import google.protobuf.json_format
 from . import *
+from . import gvas
 from . import datalib
 from . import OakProfile_pb2, OakShared_pb2
 
@@ -42,18 +43,22 @@ class BL3ProfItem(datalib.BL3Serial):
     just so we can keep track of what index it is in the profile.
     """
 
-    def __init__(self, serial_number, container, index, datawrapper):
+    __slots__ = ('container', 'index')
+
+    def __init__(self, serial_number, container, index, datawrapper, decrypted=None):
         self.container = container
         self.index = index
-        super().__init__(serial_number, datawrapper)
+        super().__init__(serial_number, datawrapper, decrypted)
 
     @staticmethod
-    def create(serial_number, container, datawrapper):
+    def create(serial_number, container, datawrapper, decrypted=None):
         """
         Creates a new item with the specified serial number, in the specified
-        `container`
+        `container`.  If the serial's already been decrypted (via
+        `datalib.decrypt_serials`), pass the result in as `decrypted` (or
+        pass a `datalib.BL3Serial` for it, to re-use its parsed data as well).
         """
-        return BL3ProfItem(serial_number, container, -1, datawrapper)
+        return BL3ProfItem(serial_number, container, -1, datawrapper, decrypted)
 
     def _update_superclass_serial(self):
         """
@@ -90,71 +95,75 @@ class BL3Profile(object):
         0x7D, 0x51, 0xB0, 0x1E, 0xBE, 0xD0, 0x77, 0x43,
         ])
 
-    def __init__(self, filename, debug=False):
+    _codec = gvas.PayloadCodec(_prefix_magic, _xor_magic)
+
+    # Used by `bl3save.open_any` to recognize our files: a string found in
+    # the GVAS header's `sg_type`, and our top-level protobuf message.
+    _sg_type_marker = 'OakProfile'
+    _protobuf_class = OakProfile_pb2.Profile
+
+    # Attributes which only exist once our payload's been loaded.  Only really
+    # relevant when we've been opened with `lazy=True`.
+    _payload_attrs = ['prof']
+
+    def __init__(self, filename, debug=False, lazy=False, cache=None, datawrapper=None):
+        """
+        Loads the profile from `filename`.  If `lazy` is `True`, only the GVAS
+        header will be read at first; decrypting and parsing the protobuf data
+        will be put off until something actually needs `self.prof`.  `cache`
+        can be a `cache.PayloadCache` object, to avoid decrypting the payload
+        again if this file's been read before.  Item data is looked up through
+        `datawrapper`, which defaults to the DataWrapper shared by the whole
+        process (see `datalib.get_default_datawrapper`).
+        """
         self.filename = filename
-        self.datawrapper = datalib.DataWrapper()
-        with open(filename, 'rb') as df:
-
-            header = df.read(4)
-            assert(header == b'GVAS')
-
-            self.sg_version = self._read_int(df)
-            if debug:
-                print('Profile version: {}'.format(self.sg_version))
-            self.pkg_version = self._read_int(df)
-            if debug:
-                print('Package version: {}'.format(self.pkg_version))
-            self.engine_major = self._read_short(df)
-            self.engine_minor = self._read_short(df)
-            self.engine_patch = self._read_short(df)
-            self.engine_build = self._read_int(df)
-            if debug:
-                print('Engine version: {}.{}.{}.{}'.format(
-                    self.engine_major,
-                    self.engine_minor,
-                    self.engine_patch,
-                    self.engine_build,
-                    ))
-            self.build_id = self._read_str(df)
-            if debug:
-                print('Build ID: {}'.format(self.build_id))
-            self.fmt_version = self._read_int(df)
-            if debug:
-                print('Custom Format Version: {}'.format(self.fmt_version))
-            fmt_count = self._read_int(df)
-            if debug:
-                print('Custom Format Data Count: {}'.format(fmt_count))
-            self.custom_format_data = []
-            for _ in range(fmt_count):
-                guid = self._read_guid(df)
-                entry = self._read_int(df)
-                if debug:
-                    print(' - GUID {}: {}'.format(guid, entry))
-                self.custom_format_data.append((guid, entry))
-            self.sg_type = self._read_str(df)
-            if debug:
-                print('Profile type: {}'.format(sg_type))
-
-            # Read in the actual data
-            remaining_data_len = self._read_int(df)
-            data = bytearray(df.read(remaining_data_len))
-
-            # Decrypt
-            for i in range(len(data)-1, -1, -1):
-                if i < 32:
-                    b = BL3Profile._prefix_magic[i]
-                else:
-                    b = data[i - 32]
-                b ^= BL3Profile._xor_magic[i % 32]
-                data[i] ^= b
-
-            # Make sure that was all there was
-            last = df.read()
-            assert(len(last) == 0)
-
-            # Parse protobufs
+        self._cache = cache
+        if datawrapper is None:
+            datawrapper = datalib.get_default_datawrapper()
+        self.datawrapper = datawrapper
+
+        # Read in the header, and the decrypted protobuf data.  The file
+        # gets mmapped, so the decrypted buffer is the only copy we hold.
+        if lazy:
+            header = gvas.read_header(filename)
+        else:
+            (header, data) = gvas.read_file(filename, self._codec, cache)
+        header.copy_to(self)
+        self.payload_len = header.payload_len
+        if debug:
+            header.print_debug('Profile')
+
+        # Parse protobufs (or remember that we still have to)
+        if lazy:
+            self._pending_header = header
+        else:
+            self._pending_header = None
             self.import_protobuf(data)
 
+    def __getattr__(self, name):
+        """
+        Only called when `name` can't be found the usual way.  If we were opened
+        with `lazy=True` and haven't loaded our payload yet, this is where that
+        happens, the first time anything asks for `prof` (or anything else
+        that gets built from it).
+        """
+        if name in self._payload_attrs and self.__dict__.get('_pending_header') is not None:
+            self._load_payload()
+            return getattr(self, name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def _load_payload(self):
+        """
+        Reads, decrypts, and parses the payload that we skipped over when
+        opened with `lazy=True`.
+        """
+        expected_header = self._pending_header
+        self._pending_header = None
+        (header, data) = gvas.read_file(self.filename, self._codec, self._cache)
+        if header != expected_header:
+            raise Exception('{} has changed on disk since it was opened'.format(self.filename))
+        self.import_protobuf(data)
+
     def import_protobuf(self, data):
         """
         Given raw protobuf data, load it into ourselves so
@@ -163,11 +172,20 @@ class BL3Profile(object):
         """
 
         # Now parse the protobufs
-        self.prof = OakProfile_pb2.Profile()
+        message = OakProfile_pb2.Profile()
         try:
-            self.prof.ParseFromString(memoryview(data))
+            message.ParseFromString(memoryview(data))
         except google.protobuf.message.DecodeError as e:
             raise Exception('Unable to parse profile (did you pass a savegame, instead?): {}'.format(e)) from None
+        self._import_message(message)
+
+    def _import_message(self, message):
+        """
+        Adopts the already-parsed `Profile` protobuf `message` as our own
+        profile data.
+        """
+        self.prof = message
+        self._pending_header = None
 
     def import_json(self, json_str):
         """
@@ -175,46 +193,26 @@ class BL3Profile(object):
         that we can work with it.  This also sets up a few convenience vars
         for our later use
         """
-        message = google.protobuf.json_format.Parse(json_str, OakProfile_pb2.Profile())
-        self.import_protobuf(message.SerializeToString())
+        self._import_message(google.protobuf.json_format.Parse(json_str, OakProfile_pb2.Profile()))
 
-    def save_to(self, filename):
+    def import_json_file(self, df):
         """
-        Saves ourselves to a new filename
+        Like `import_json`, but reads the JSON from the open file object `df`
         """
-        with open(filename, 'wb') as df:
+        self._import_message(google.protobuf.json_format.ParseDict(json.load(df), OakProfile_pb2.Profile()))
 
-            # Header info
-            df.write(b'GVAS')
-            self._write_int(df, self.sg_version)
-            self._write_int(df, self.pkg_version)
-            self._write_short(df, self.engine_major)
-            self._write_short(df, self.engine_minor)
-            self._write_short(df, self.engine_patch)
-            self._write_int(df, self.engine_build)
-            self._write_str(df, self.build_id)
-            self._write_int(df, self.fmt_version)
-            self._write_int(df, len(self.custom_format_data))
-            for guid, entry in self.custom_format_data:
-                self._write_guid(df, guid)
-                self._write_int(df, entry)
-            self._write_str(df, self.sg_type)
-
-            # Turn our parsed protobuf back into data
-            data = bytearray(self.prof.SerializeToString())
-
-            # Encrypt
-            for i in range(len(data)):
-                if i < 32:
-                    b = self._prefix_magic[i]
-                else:
-                    b = data[i - 32]
-                b ^= self._xor_magic[i % 32]
-                data[i] ^= b
-
-            # Write out to the file
-            self._write_int(df, len(data))
-            df.write(data)
+    def save_to(self, filename):
+        """
+        Saves ourselves to a new filename.  The file is written atomically, and
+        is left alone entirely if its contents wouldn't actually change.
+        Returns `True` if the file was written, or `False` if it was already
+        up to date.
+        """
+        return gvas.write_file(filename,
+                gvas.GVASHeader.from_object(self),
+                self.prof.SerializeToString(),
+                self._codec,
+                )
 
     def save_protobuf_to(self, filename):
         """
@@ -229,58 +227,10 @@ class BL3Profile(object):
         """
         with open(filename, 'w') as df:
             df.write(google.protobuf.json_format.MessageToJson(self.prof,
-                including_default_value_fields=True,
+                always_print_fields_with_no_presence=True,
                 preserving_proto_field_name=True,
                 ))
 
-    def _read_int(self, df):
-        return struct.unpack('<I', df.read(4))[0]
-
-    def _write_int(self, df, value):
-        df.write(struct.pack('<I', value))
-
-    def _read_short(self, df):
-        return struct.unpack('<H', df.read(2))[0]
-
-    def _write_short(self, df, value):
-        df.write(struct.pack('<H', value))
-
-    def _read_str(self, df):
-        datalen = self._read_int(df)
-        if datalen == 0:
-            return None
-        elif datalen == 1:
-            return ''
-        else:
-            value = df.read(datalen)
-            return value[:-1].decode('utf-8')
-
-    def _write_str(self, df, value):
-        if value is None:
-            self._write_int(df, 0)
-        elif value == '':
-            self._write_int(df, 1)
-        else:
-            data = value.encode('utf-8') + b'\0'
-            self._write_int(df, len(data))
-            df.write(data)
-
-    def _read_guid(self, df):
-        data = df.read(16)
-        return data
-        # A bit silly to bother formatting it, since we don't care.
-        #arr = ''.join(['{:02x}'.format(d) for d in data])
-        #return '{}-{}-{}-{}-{}'.format(
-        #        arr[0:8],
-        #        arr[8:12],
-        #        arr[12:16],
-        #        arr[16:20],
-        #        arr[20:32],
-        #        )
-
-    def _write_guid(self, df, value):
-        df.write(value)
-
     def get_sdus(self, eng=False):
         """
         Returns a dict containing the SDU type and the number purchased.  The SDU
@@ -345,14 +295,28 @@ class BL3Profile(object):
                 sdu_level=psdu_to_max[psdu],
                 ))
 
-    def create_new_item(self, item_serial):
+    def create_new_item(self, item_serial, decrypted=None):
         """
         Creates a new item (as a BL3ProfItem object) from the given binary `item_serial`,
         which can later be added to our item bank list.
         """
 
         # Create the item and return it
-        return BL3ProfItem.create(item_serial, self.prof.bank_inventory_list, self.datawrapper)
+        return BL3ProfItem.create(item_serial, self.prof.bank_inventory_list, self.datawrapper, decrypted)
+
+    def create_new_items(self, item_serials, decrypted=None):
+        """
+        Creates a list of new items (as BL3ProfItem objects) from the given
+        binary `item_serials`, which can later be added to our item bank list
+        with `add_bank_items`.  If the serials have already been decrypted,
+        `decrypted` can be the matching list of results from
+        `datalib.decrypt_serials` (or of `datalib.BL3Serial` objects for
+        them, whose parsed data will be re-used as well).
+        """
+        if decrypted is None:
+            decrypted = [None]*len(item_serials)
+        return [self.create_new_item(item_serial, item_decrypted)
+                for (item_serial, item_decrypted) in zip(item_serials, decrypted)]
 
     def create_new_item_encoded(self, item_serial_b64):
         """
@@ -362,17 +326,33 @@ class BL3Profile(object):
         """
         return self.create_new_item(datalib.BL3Serial.decode_serial_base64(item_serial_b64))
 
+    def _get_items(self, container):
+        """
+        Returns the serials in `container` as a list of BL3ProfItem objects,
+        decrypting them all in one batch.
+        """
+        serials = list(container)
+        return [BL3ProfItem(s, container, idx, self.datawrapper, decrypted)
+                for idx, (s, decrypted) in enumerate(zip(serials, datalib.decrypt_serials(serials)))]
+
     def get_lostloot_items(self):
         """
         Returns a list of this profile's Lost Loot items, as BL3ProfItem objects.
         """
-        return [BL3ProfItem(s, self.prof.lost_loot_inventory_list, idx, self.datawrapper) for idx, s in enumerate(self.prof.lost_loot_inventory_list)]
+        return self._get_items(self.prof.lost_loot_inventory_list)
 
     def get_bank_items(self):
         """
         Returns a list of this profile's bank items, as BL3ProfItem objects.
         """
-        return [BL3ProfItem(s, self.prof.bank_inventory_list, idx, self.datawrapper) for idx, s in enumerate(self.prof.bank_inventory_list)]
+        return self._get_items(self.prof.bank_inventory_list)
+
+    def get_bank_item_serials(self):
+        """
+        Returns a list of the raw binary serial numbers of this profile's
+        bank items, without wrapping them in BL3ProfItem objects.
+        """
+        return list(self.prof.bank_inventory_list)
 
     def add_bank_item(self, item_serial):
         """
@@ -384,6 +364,16 @@ class BL3Profile(object):
         else:
             self.prof.bank_inventory_list.append(item_serial)
 
+    def add_bank_items(self, item_serials):
+        """
+        Adds a whole batch of new items to our item list at once.  Each entry in
+        `item_serials` should either be a `BL3ProfItem` object or a raw-data
+        serial number.
+        """
+        self.prof.bank_inventory_list.extend([
+            item_serial.get_serial_number() if type(item_serial) == BL3ProfItem else item_serial
+            for item_serial in item_serials])
+
     def get_cur_customizations(self, cust_set):
         """
         Returns a set of the currently-unlocked customizations which live in the
@@ -21,23 +21,35 @@
 # 
 # 3. This notice may not be removed or altered from any source distribution.
 
-# The encryption/decryption stanzas in BL3Save.__init__ and BL3Save.save_to
-# were helpfully provided by Gibbed (rick 'at' gibbed 'dot' us), so many
-# thanks for that!  https://twitter.com/gibbed/status/1246863435868049410?s=19
+# The encryption/decryption scheme used by BL3Save.__init__ and BL3Save.save_to
+# (which now lives in gvas.PayloadCodec) was helpfully provided by Gibbed
+# (rick 'at' gibbed 'dot' us), so many thanks for that!
+# https://twitter.com/gibbed/status/1246863435868049410?s=19
 #
 # The rest of the savegame format was gleaned from 13xforever/Ilya's
 # "gvas-converter" project: https://github.com/13xforever/gvas-converter
 
+import json
 import uuid
-import struct
+import collections.abc
 import google.protobuf
 import google.protobuf.json_format
 from . import *
+from . import gvas
+from . import protowire
 from . import datalib
 from . import OakSave_pb2, OakShared_pb2
 
 MissionState = OakSave_pb2.MissionStatusPlayerSaveGameData.MissionState
 
+# Whether protobuf is running its pure-Python implementation, rather than
+# one of its C-based ones.  See `BL3Save.summary_scan_max_len`.
+try:
+    from google.protobuf.internal import api_implementation
+    _protobuf_is_python = api_implementation.Type() == 'python'
+except ImportError:
+    _protobuf_is_python = False
+
 class BL3Item(datalib.BL3Serial):
     """
     Pretty thin wrapper around the protobuf object for an item.  We're
@@ -50,14 +62,20 @@ class BL3Item(datalib.BL3Serial):
     things like money and ammo).
     """
 
-    def __init__(self, protobuf, datawrapper):
+    __slots__ = ('protobuf',)
+
+    def __init__(self, protobuf, datawrapper, decrypted=None):
         self.protobuf = protobuf
-        super().__init__(self.protobuf.item_serial_number, datawrapper)
+        super().__init__(self.protobuf.item_serial_number, datawrapper, decrypted)
 
     @staticmethod
-    def create(datawrapper, serial_number, pickup_order_idx, skin_path='', is_seen=True, is_favorite=False, is_trash=False):
+    def create(datawrapper, serial_number, pickup_order_idx, skin_path='', is_seen=True, is_favorite=False, is_trash=False,
+            decrypted=None):
         """
         Creates a new item with the specified serial number, pickup_order_idx, and skin_path.
+        If the serial's already been decrypted (via `datalib.decrypt_serials`),
+        pass the result in as `decrypted` so we don't have to do it again (or
+        pass a `datalib.BL3Serial` for it, to re-use its parsed data as well).
         """
 
         # Start constructing flags
@@ -77,7 +95,7 @@ class BL3Item(datalib.BL3Serial):
                 pickup_order_index=pickup_order_idx,
                 flags=flags,
                 weapon_skin_path=skin_path,
-                ), datawrapper)
+                ), datawrapper, decrypted)
 
     def get_pickup_order_idx(self):
         return self.protobuf.pickup_order_index
@@ -89,6 +107,69 @@ class BL3Item(datalib.BL3Serial):
         """
         self.protobuf.item_serial_number = self.serial
 
+class BL3ItemList(collections.abc.Sequence):
+    """
+    The list of BL3Item objects for a savegame's inventory.  Wrapping an item
+    means decrypting and checksumming its serial number, which adds up for
+    a big backpack, and plenty of edits never look at inventory at all.  So
+    this acts like a regular list, but each BL3Item is only created the
+    first time it's asked for (by index or by iterating), and then kept
+    around so that we always hand back the same object for a given index.
+    """
+
+    def __init__(self, protobufs, datawrapper):
+        self.protobufs = protobufs
+        self.datawrapper = datawrapper
+        self._items = [None]*len(protobufs)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._items)))]
+        item = self._items[index]
+        if item is None:
+            item = BL3Item(self.protobufs[index], self.datawrapper)
+            self._items[index] = item
+        return item
+
+    def __iter__(self):
+        for index in range(len(self._items)):
+            yield self[index]
+
+    def __repr__(self):
+        return 'BL3ItemList({} items)'.format(len(self._items))
+
+    def append(self, new_item):
+        """
+        Appends the BL3Item object `new_item`, adding its protobuf to the
+        savegame's inventory as well.
+        """
+        self.protobufs.append(new_item.protobuf)
+
+        # The protobuf reference that we append to the protobuf list
+        # ends up *not* being the one that's actually used when we
+        # save, so if we want to be able to alter it later (say, below
+        # when levelling up items), we have to grab a fresh reference
+        # to it.
+        new_item.protobuf = self.protobufs[-1]
+        self._items.append(new_item)
+
+    def extend(self, new_items):
+        """
+        Appends all the BL3Item objects in `new_items` in one go, adding
+        their protobufs to the savegame's inventory as well.
+        """
+        new_items = list(new_items)
+        start = len(self.protobufs)
+        self.protobufs.extend([item.protobuf for item in new_items])
+
+        # Same deal as in `append` -- grab fresh protobuf references.
+        for (new_item, protobuf) in zip(new_items, self.protobufs[start:]):
+            new_item.protobuf = protobuf
+        self._items.extend(new_items)
+
 class BL3EquipSlot(object):
     """
     Real simple wrapper for a BL3 equipment slot.
@@ -101,6 +182,8 @@ class BL3EquipSlot(object):
     some decorations for that instead.  Alas!
     """
 
+    __slots__ = ('protobuf',)
+
     def __init__(self, protobuf):
         self.protobuf = protobuf
 
@@ -170,70 +253,96 @@ class BL3Save(object):
         0xCD, 0xD8, 0xB1, 0xCC, 0xA1, 0x33, 0xF9, 0xB6,
         ])
 
-    def __init__(self, filename, debug=False):
+    _codec = gvas.PayloadCodec(_prefix_magic, _xor_magic)
+
+    # Used by `bl3save.open_any` to recognize our files: a string found in
+    # the GVAS header's `sg_type`, and our top-level protobuf message.
+    _sg_type_marker = 'OakSaveGame'
+    _protobuf_class = OakSave_pb2.Character
+
+    # Top-level `Character` field numbers which `get_summary` reads straight
+    # out of the raw protobuf data, when we haven't parsed it.
+    _summary_fields = {
+            'savegame_id': 1,
+            'player_class_data': 4,
+            'xp': 7,
+            'playthroughs_completed': 15,
+            'char_name': 43,
+            'savegame_guid': 56,
+            }
+
+    # Reading those fields straight out of the raw data saves us from
+    # decrypting and parsing the whole payload, but our wire scanner is pure
+    # Python.  Against protobuf's C parser, a full parse turns out to be
+    # quicker at every size we've tried (from a few times quicker on normal
+    # saves, to about four times on a 7MB one), so the scan only pays off
+    # when protobuf is running in pure Python as well, where it's five to ten
+    # times quicker than parsing.  `get_summary` only scans payloads up to
+    # this many bytes, and fully parses anything larger (`None` means no
+    # limit).  See `tests/bench_save_summary.py`.
+    summary_scan_max_len = None if _protobuf_is_python else 0
+
+    # Attributes which only exist once our payload's been loaded.  Only really
+    # relevant when we've been opened with `lazy=True`.
+    _payload_attrs = ['save', 'items', 'equipslots']
+
+    def __init__(self, filename, debug=False, lazy=False, cache=None, datawrapper=None):
+        """
+        Loads the savegame from `filename`.  If `lazy` is `True`, only the GVAS
+        header will be read at first; decrypting and parsing the protobuf data
+        will be put off until something actually needs `self.save`.  `cache`
+        can be a `cache.PayloadCache` object, to avoid decrypting the payload
+        again if this file's been read before.  Item data is looked up through
+        `datawrapper`, which defaults to the DataWrapper shared by the whole
+        process (see `datalib.get_default_datawrapper`).
+        """
         self.filename = filename
-        self.datawrapper = datalib.DataWrapper()
-        with open(filename, 'rb') as df:
-
-            header = df.read(4)
-            assert(header == b'GVAS')
-
-            self.sg_version = self._read_int(df)
-            if debug:
-                print('Savegame version: {}'.format(self.sg_version))
-            self.pkg_version = self._read_int(df)
-            if debug:
-                print('Package version: {}'.format(self.pkg_version))
-            self.engine_major = self._read_short(df)
-            self.engine_minor = self._read_short(df)
-            self.engine_patch = self._read_short(df)
-            self.engine_build = self._read_int(df)
-            if debug:
-                print('Engine version: {}.{}.{}.{}'.format(
-                    self.engine_major,
-                    self.engine_minor,
-                    self.engine_patch,
-                    self.engine_build,
-                    ))
-            self.build_id = self._read_str(df)
-            if debug:
-                print('Build ID: {}'.format(self.build_id))
-            self.fmt_version = self._read_int(df)
-            if debug:
-                print('Custom Format Version: {}'.format(self.fmt_version))
-            fmt_count = self._read_int(df)
-            if debug:
-                print('Custom Format Data Count: {}'.format(fmt_count))
-            self.custom_format_data = []
-            for _ in range(fmt_count):
-                guid = self._read_guid(df)
-                entry = self._read_int(df)
-                if debug:
-                    print(' - GUID {}: {}'.format(guid, entry))
-                self.custom_format_data.append((guid, entry))
-            self.sg_type = self._read_str(df)
-            if debug:
-                print('Savegame type: {}'.format(self.sg_type))
-
-            # Read in the actual data
-            remaining_data_len = self._read_int(df)
-            data = bytearray(df.read(remaining_data_len))
-
-            # Decrypt
-            for i in range(len(data)-1, -1, -1):
-                if i < 32:
-                    b = BL3Save._prefix_magic[i]
-                else:
-                    b = data[i - 32]
-                b ^= BL3Save._xor_magic[i % 32]
-                data[i] ^= b
+        self._cache = cache
+        if datawrapper is None:
+            datawrapper = datalib.get_default_datawrapper()
+        self.datawrapper = datawrapper
+
+        # Read in the header, and the decrypted protobuf data.  The file
+        # gets mmapped, so the decrypted buffer is the only copy we hold.
+        if lazy:
+            header = gvas.read_header(filename)
+        else:
+            (header, data) = gvas.read_file(filename, self._codec, cache)
+        header.copy_to(self)
+        self.payload_len = header.payload_len
+        if debug:
+            header.print_debug('Savegame')
+
+        # Parse protobufs (or remember that we still have to)
+        if lazy:
+            self._pending_header = header
+        else:
+            self._pending_header = None
+            self.import_protobuf(data)
 
-            # Make sure that was all there was
-            last = df.read()
-            assert(len(last) == 0)
+    def __getattr__(self, name):
+        """
+        Only called when `name` can't be found the usual way.  If we were opened
+        with `lazy=True` and haven't loaded our payload yet, this is where that
+        happens, the first time anything asks for `save` (or anything else
+        that gets built from it).
+        """
+        if name in self._payload_attrs and self.__dict__.get('_pending_header') is not None:
+            self._load_payload()
+            return getattr(self, name)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
 
-            # Parse protobufs
-            self.import_protobuf(data)
+    def _load_payload(self):
+        """
+        Reads, decrypts, and parses the payload that we skipped over when
+        opened with `lazy=True`.
+        """
+        expected_header = self._pending_header
+        self._pending_header = None
+        (header, data) = gvas.read_file(self.filename, self._codec, self._cache)
+        if header != expected_header:
+            raise Exception('{} has changed on disk since it was opened'.format(self.filename))
+        self.import_protobuf(data)
 
     def import_protobuf(self, data):
         """
@@ -243,11 +352,20 @@ class BL3Save(object):
         """
 
         # Now parse the protobufs
-        self.save = OakSave_pb2.Character()
+        message = OakSave_pb2.Character()
         try:
-            self.save.ParseFromString(memoryview(data))
+            message.ParseFromString(memoryview(data))
         except google.protobuf.message.DecodeError as e:
             raise Exception('Unable to parse savegame (did you pass a profile, instead?): {}'.format(e)) from None
+        self._import_message(message)
+
+    def _import_message(self, message):
+        """
+        Adopts the already-parsed `Character` protobuf `message` as our own
+        savegame data, and sets up our convenience vars.
+        """
+        self.save = message
+        self._pending_header = None
 
         # Some sanity checks, since this is a potentially problematic
         # operation.
@@ -260,8 +378,8 @@ class BL3Save(object):
         #assert(len(data) == self.save.ByteSize())
 
         # Do some data processing so that we can wrap things APIwise
-        # First: Items
-        self.items = [BL3Item(i, self.datawrapper) for i in self.save.inventory_items]
+        # First: Items (which only get decrypted once something asks for them)
+        self.items = BL3ItemList(self.save.inventory_items, self.datawrapper)
 
         # Next: Equip slots
         self.equipslots = {}
@@ -276,46 +394,26 @@ class BL3Save(object):
         that we can work with it.  This also sets up a few convenience vars
         for our later use
         """
-        message = google.protobuf.json_format.Parse(json_str, OakSave_pb2.Character())
-        self.import_protobuf(message.SerializeToString())
+        self._import_message(google.protobuf.json_format.Parse(json_str, OakSave_pb2.Character()))
 
-    def save_to(self, filename):
+    def import_json_file(self, df):
         """
-        Saves ourselves to a new filename
+        Like `import_json`, but reads the JSON from the open file object `df`
         """
-        with open(filename, 'wb') as df:
-
-            # Header info
-            df.write(b'GVAS')
-            self._write_int(df, self.sg_version)
-            self._write_int(df, self.pkg_version)
-            self._write_short(df, self.engine_major)
-            self._write_short(df, self.engine_minor)
-            self._write_short(df, self.engine_patch)
-            self._write_int(df, self.engine_build)
-            self._write_str(df, self.build_id)
-            self._write_int(df, self.fmt_version)
-            self._write_int(df, len(self.custom_format_data))
-            for guid, entry in self.custom_format_data:
-                self._write_guid(df, guid)
-                self._write_int(df, entry)
-            self._write_str(df, self.sg_type)
-
-            # Turn our parsed protobuf back into data
-            data = bytearray(self.save.SerializeToString())
-
-            # Encrypt
-            for i in range(len(data)):
-                if i < 32:
-                    b = self._prefix_magic[i]
-                else:
-                    b = data[i - 32]
-                b ^= self._xor_magic[i % 32]
-                data[i] ^= b
+        self._import_message(google.protobuf.json_format.ParseDict(json.load(df), OakSave_pb2.Character()))
 
-            # Write out to the file
-            self._write_int(df, len(data))
-            df.write(data)
+    def save_to(self, filename):
+        """
+        Saves ourselves to a new filename.  The file is written atomically, and
+        is left alone entirely if its contents wouldn't actually change.
+        Returns `True` if the file was written, or `False` if it was already
+        up to date.
+        """
+        return gvas.write_file(filename,
+                gvas.GVASHeader.from_object(self),
+                self.save.SerializeToString(),
+                self._codec,
+                )
 
     def save_protobuf_to(self, filename):
         """
@@ -330,58 +428,10 @@ class BL3Save(object):
         """
         with open(filename, 'w') as df:
             df.write(google.protobuf.json_format.MessageToJson(self.save,
-                including_default_value_fields=True,
+                always_print_fields_with_no_presence=True,
                 preserving_proto_field_name=True,
                 ))
 
-    def _read_int(self, df):
-        return struct.unpack('<I', df.read(4))[0]
-
-    def _write_int(self, df, value):
-        df.write(struct.pack('<I', value))
-
-    def _read_short(self, df):
-        return struct.unpack('<H', df.read(2))[0]
-
-    def _write_short(self, df, value):
-        df.write(struct.pack('<H', value))
-
-    def _read_str(self, df):
-        datalen = self._read_int(df)
-        if datalen == 0:
-            return None
-        elif datalen == 1:
-            return ''
-        else:
-            value = df.read(datalen)
-            return value[:-1].decode('utf-8')
-
-    def _write_str(self, df, value):
-        if value is None:
-            self._write_int(df, 0)
-        elif value == '':
-            self._write_int(df, 1)
-        else:
-            data = value.encode('utf-8') + b'\0'
-            self._write_int(df, len(data))
-            df.write(data)
-
-    def _read_guid(self, df):
-        data = df.read(16)
-        return data
-        # A bit silly to bother formatting it, since we don't care.
-        #arr = ''.join(['{:02x}'.format(d) for d in data])
-        #return '{}-{}-{}-{}-{}'.format(
-        #        arr[0:8],
-        #        arr[8:12],
-        #        arr[12:16],
-        #        arr[16:20],
-        #        arr[20:32],
-        #        )
-
-    def _write_guid(self, df, value):
-        df.write(value)
-
     def get_char_name(self):
         """
         Returns the character name
@@ -448,7 +498,13 @@ class BL3Save(object):
         """
         Returns the character's level
         """
-        xp = self.get_xp()
+        return self._xp_to_level(self.get_xp())
+
+    @staticmethod
+    def _xp_to_level(xp):
+        """
+        Returns the level corresponding to the given amount of `xp`
+        """
         cur_lvl = 0
         for req_xp_lvl in required_xp_list:
             if xp >= req_xp_lvl:
@@ -506,6 +562,60 @@ class BL3Save(object):
                 if level >= challenge_level:
                     self.unlock_challenge_obj(challenge_obj)
 
+    def get_summary(self, eng=False):
+        """
+        Returns a dict containing a few basic bits of info about the character:
+        `char_name`, `class`, `level`, `xp`, `savegame_id`, `savegame_guid`, and
+        `playthroughs_completed`.  `class` will be a constant by default, or an
+        English label if `eng` is `True` (and `None` if it's unrecognized).
+
+        If we were opened with `lazy=True` and haven't loaded our payload yet,
+        and the payload isn't larger than `summary_scan_max_len`, this won't
+        load it.  Instead, the fields are read straight out of the raw protobuf
+        data, only decrypting the bits of the file we need to find them.
+        """
+        if self.__dict__.get('_pending_header') is None or \
+                (self.summary_scan_max_len is not None and self.payload_len > self.summary_scan_max_len):
+            summary = {
+                    'char_name': self.save.preferred_character_name,
+                    'class_path': self.save.player_class_data.player_class_path,
+                    'xp': self.save.experience_points,
+                    'savegame_id': self.save.save_game_id,
+                    'savegame_guid': self.save.save_game_guid,
+                    'playthroughs_completed': self.save.playthroughs_completed,
+                    }
+        else:
+            summary = self._read_summary()
+        summary['level'] = self._xp_to_level(summary['xp'])
+        classval = classobj_to_class.get(summary.pop('class_path'))
+        if eng and classval is not None:
+            summary['class'] = class_to_eng[classval]
+        else:
+            summary['class'] = classval
+        return summary
+
+    def _read_summary(self):
+        """
+        Reads the fields for `get_summary` out of our still-encrypted payload
+        """
+        fields = self._summary_fields
+        with gvas.open_payload(self.filename, self._codec) as (header, payload):
+            if header != self._pending_header:
+                raise Exception('{} has changed on disk since it was opened'.format(self.filename))
+            raw = protowire.extract_fields(payload, fields.values())
+        if fields['player_class_data'] in raw:
+            class_data = protowire.extract_fields(raw[fields['player_class_data']], [1])
+        else:
+            class_data = {}
+        return {
+                'char_name': bytes(raw.get(fields['char_name'], b'')).decode('utf-8'),
+                'class_path': bytes(class_data.get(1, b'')).decode('utf-8'),
+                'xp': protowire.to_signed(raw.get(fields['xp'], 0)),
+                'savegame_id': raw.get(fields['savegame_id'], 0),
+                'savegame_guid': bytes(raw.get(fields['savegame_guid'], b'')).decode('utf-8'),
+                'playthroughs_completed': protowire.to_signed(raw.get(fields['playthroughs_completed'], 0)),
+                }
+
     def get_playthroughs_completed(self):
         """
         Returns the number of playthroughs completed
@@ -960,9 +1070,18 @@ class BL3Save(object):
     def get_items(self):
         """
         Returns a list of the character's inventory items, as BL3Item objects.
+        (Strictly speaking, this is a BL3ItemList, which behaves like a list
+        but only decrypts items as they're accessed.)
         """
         return self.items
 
+    def get_item_serials(self):
+        """
+        Returns a list of the raw binary serial numbers of the character's
+        inventory items, without wrapping them in BL3Item objects.
+        """
+        return [item.item_serial_number for item in self.save.inventory_items]
+
     def get_equipped_items(self, eng=False):
         """
         Returns a dict containing the slot and the equipped item.  The slot will
@@ -1027,7 +1146,7 @@ class BL3Save(object):
         """
 
         del self.save.inventory_items[:]
-        self.items = []
+        self.items = BL3ItemList(self.save.inventory_items, self.datawrapper)
         for slot in self.equipslots.values():
             slot.protobuf.inventory_list_index = -1
 
@@ -1037,42 +1156,67 @@ class BL3Save(object):
         new index in our item list.
         """
 
-        # Add the item to the protobuf
-        self.save.inventory_items.append(new_item.protobuf)
-
-        # The protobuf reference that we append to the protobuf list
-        # ends up *not* being the one that's actually used when we
-        # save, so if we want to be able to alter it later (say, below
-        # when levelling up items), we have to grab a fresh reference
-        # to it.
-        new_item.protobuf = self.save.inventory_items[-1]
-
-        # Now update our internal items list and return
+        # Our item list takes care of adding it to the protobuf, too
         self.items.append(new_item)
         return len(self.items)-1
 
-    def create_new_item(self, item_serial):
+    def add_items(self, new_items):
         """
-        Creates a new item from the given binary `item_serial`, which can later
-        be added to our item list.
+        Adds all the BL3Item objects in `new_items` to our item list at once.
+        Returns the index of the first new item in our item list.
+        """
+        start = len(self.items)
+        self.items.extend(new_items)
+        return start
+
+    def _get_max_pickup_order(self):
+        """
+        Returns the highest `pickup_order_index` currently found in our
+        inventory.
         """
 
         # Okay, I have no idea what this pickup_order_index attribute is about, but let's
         # make sure it's unique anyway.  It might be related to ordering when picking
         # up multiple items at once, which would probably make it more useful for auto-pick-up
         # items like money and ammo...
+        # (This reads straight from the protobufs, so that we don't have to
+        # decrypt every item in the inventory just to find out.)
         max_pickup_order = 0
-        for item in self.items:
-            if item.get_pickup_order_idx() > max_pickup_order:
-                max_pickup_order = item.get_pickup_order_idx()
-
-        # Create the item and return it
-        new_item = BL3Item.create(self.datawrapper,
-                serial_number=item_serial,
-                pickup_order_idx=max_pickup_order+1,
-                is_favorite=True,
-                )
-        return new_item
+        for item in self.save.inventory_items:
+            if item.pickup_order_index > max_pickup_order:
+                max_pickup_order = item.pickup_order_index
+        return max_pickup_order
+
+    def create_new_item(self, item_serial):
+        """
+        Creates a new item from the given binary `item_serial`, which can later
+        be added to our item list.
+        """
+        return self.create_new_items([item_serial])[0]
+
+    def create_new_items(self, item_serials, decrypted=None):
+        """
+        Creates a list of new items from the given binary `item_serials`, which
+        can later be added to our item list with `add_items`.  The items get
+        consecutive pickup order indexes, just as if they'd been created and
+        added one at a time, but we only have to look through the inventory
+        once to find out where to start.  If the serials have already been
+        decrypted, `decrypted` can be the matching list of results from
+        `datalib.decrypt_serials` (or of `datalib.BL3Serial` objects for
+        them, whose parsed data will be re-used as well).
+        """
+        if decrypted is None:
+            decrypted = [None]*len(item_serials)
+        max_pickup_order = self._get_max_pickup_order()
+        new_items = []
+        for (idx, (item_serial, item_decrypted)) in enumerate(zip(item_serials, decrypted), start=max_pickup_order+1):
+            new_items.append(BL3Item.create(self.datawrapper,
+                    serial_number=item_serial,
+                    pickup_order_idx=idx,
+                    is_favorite=True,
+                    decrypted=item_decrypted,
+                    ))
+        return new_items
 
     def create_new_item_encoded(self, item_serial_b64):
         """
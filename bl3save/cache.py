@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+import os
+import sys
+import uuid
+import pickle
+import hashlib
+
+def user_cache_dir():
+    """
+    Returns the per-user directory we should be storing cached data in,
+    following the usual conventions for the platform we're running on.  The
+    directory is not created.
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    elif sys.platform == 'darwin':
+        base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'bl3-cli-saveedit')
+
+class PayloadCache(object):
+    """
+    An on-disk cache of decrypted savegame/profile payloads, so that
+    re-reading a file which hasn't changed doesn't have to decrypt it all over
+    again.  Entries are keyed on the file's full path, size, and modification
+    time, plus a hash of its GVAS header, so any change to the file (or a
+    different file showing up at the same path) just results in a miss.
+
+    The cache is bounded to `max_size` bytes.  Every hit bumps the entry's
+    mtime, and when storing a new entry pushes us over the limit, the entries
+    which were least-recently used get removed.  We keep a running total of
+    the cache's size so that we don't have to look at every entry on every
+    `put`; the directory only gets scanned the first time we store something,
+    and again whenever we need to evict (which also picks up anything other
+    processes have done in the meantime).  Any errors reading from or writing
+    to the cache are ignored; at worst we just decrypt the file like we would
+    have anyway.
+    """
+
+    default_max_size = 256*1024*1024
+
+    # When we do have to evict, clear out enough to get down to this fraction
+    # of `max_size`, so that a full cache isn't rescanned on every `put`.
+    evict_target = 0.9
+
+    suffix = '.payload'
+
+    def __init__(self, directory=None, max_size=None):
+        if directory is None:
+            directory = os.path.join(user_cache_dir(), 'payloads')
+        if max_size is None:
+            max_size = self.default_max_size
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._total = None
+
+    def make_key(self, filename, header_data):
+        """
+        Returns the cache key for `filename`, whose raw GVAS header (up to the
+        start of the payload) is `header_data`.
+        """
+        stat = os.stat(filename)
+        key = hashlib.sha256()
+        key.update('{}\0{}\0{}\0'.format(
+            os.path.abspath(filename),
+            stat.st_size,
+            stat.st_mtime_ns,
+            ).encode('utf-8'))
+        key.update(hashlib.sha256(header_data).digest())
+        return key.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key, length):
+        """
+        Returns the cached payload for `key` as a bytearray, or `None` if we
+        don't have it.  `length` is the length the payload should be; anything
+        else is treated as a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as df:
+                data = bytearray(length)
+                if df.readinto(data) != length or df.read(1) != b'':
+                    data = None
+            if data is not None:
+                os.utime(path)
+        except OSError:
+            data = None
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        Stores `data` in the cache under `key`, and then evicts old entries if
+        we've grown past our size limit.
+        """
+        path = self._path(key)
+        temp_path = os.path.join(self.directory, '.{}.{}.tmp'.format(key, uuid.uuid4().hex))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as df:
+                df.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._entries())
+        else:
+            self._total += len(data)
+        if self._total > self.max_size:
+            self.evict()
+
+    def _entries(self):
+        """
+        Returns a list of `(mtime_ns, size, path)` tuples for all our entries
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def evict(self):
+        """
+        Removes least-recently-used entries if we're over `max_size`, until
+        we're down to `evict_target` of it
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_size:
+            target = int(self.max_size*self.evict_target)
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        self._total = total
+
+    def clear(self):
+        """
+        Removes all our cached entries, returning how many were removed
+        """
+        removed = 0
+        for _, _, path in self._entries():
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        self._total = None
+        return removed
+
+class ResourceCache(object):
+    """
+    An on-disk cache of our decoded data resources (the `.json.xz` files in
+    `resources/`), so that each new process doesn't have to decompress and
+    parse them all over again.  They're stored as pickles, which load quite
+    a bit quicker.
+
+    Entries are keyed on a hash of the packaged resource file itself, so
+    whenever the resources get updated, the next load just misses and
+    rebuilds the entry (clearing out the old one).  `version` should be
+    bumped if the way we store the data ever changes.  Just like with
+    `PayloadCache`, any errors reading from or writing to the cache are
+    ignored, and we fall back to decoding the resource ourselves.
+    """
+
+    version = 1
+
+    suffix = '.pickle'
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = os.path.join(user_cache_dir(), 'resources')
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _prefix(self, name):
+        return '{}-v{}-'.format(name, self.version)
+
+    def load(self, name, raw_data, decode_func):
+        """
+        Returns the decoded data for the resource `name`, whose packaged
+        contents are `raw_data`.  If we don't have it cached already,
+        `decode_func` will be called with `raw_data` to decode it, and the
+        result gets stored for next time.
+        """
+        path = os.path.join(self.directory, '{}{}{}'.format(
+            self._prefix(name),
+            hashlib.sha256(raw_data).hexdigest(),
+            self.suffix,
+            ))
+        try:
+            with open(path, 'rb') as df:
+                data = pickle.load(df)
+            self.hits += 1
+            return data
+        except Exception:
+            pass
+
+        self.misses += 1
+        data = decode_func(raw_data)
+        self._store(name, path, data)
+        return data
+
+    def _store(self, name, path, data):
+        """
+        Writes `data` out to `path`, and then removes any other (outdated)
+        entries for the resource `name`.
+        """
+        temp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_path, 'wb') as df:
+                pickle.dump(data, df, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+
+        for entry_path in self._entries():
+            entry_name = os.path.basename(entry_path)
+            if entry_name.startswith(name + '-') and entry_path != path:
+                try:
+                    os.unlink(entry_path)
+                except OSError:
+                    pass
+
+    def _entries(self):
+        """
+        Returns a list of paths for all our entries
+        """
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(self.suffix):
+                        entries.append(entry.path)
+        except OSError:
+            pass
+        return entries
+
+    def clear(self):
+        """
+        Removes all our cached entries, returning how many were removed
+        """
+        removed = 0
+        for path in self._entries():
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
@@ -25,6 +25,7 @@ import os
 import sys
 import argparse
 import bl3save
+from . import cli_common
 from bl3save.bl3save import BL3Save
 
 def main():
@@ -66,8 +67,11 @@ def main():
             action='store_true',
             help='Clobber (overwrite) files without asking')
 
+    cli_common.add_cache_args(parser)
+
     # Parse args
     args = parser.parse_args()
+    cache = cli_common.get_cache(args)
     if not args.filename and not args.directory:
         args.directory = 'step'
 
@@ -140,7 +144,7 @@ def main():
 
         # Load!
         print('Processing: {}'.format(filename))
-        save = BL3Save(filename)
+        save = BL3Save(filename, cache=cache)
 
         # Write to our info file, if we have it
         if args.info:
@@ -21,8 +21,12 @@
 # 
 # 3. This notice may not be removed or altered from any source distribution.
 
+import os
 import csv
 import argparse
+import itertools
+from . import datalib
+from .cache import PayloadCache
 
 class DictAction(argparse.Action):
     """
@@ -48,6 +52,50 @@ class DictAction(argparse.Action):
         arg_value[values] = True
         setattr(namespace, self.dest, arg_value)
 
+def add_cache_args(parser):
+    """
+    Adds the arguments controlling our decrypted-payload cache to the
+    argparse `parser`.  The cache is off by default, unless the
+    `BL3_SAVEEDIT_CACHE` environment variable is set to something nonempty.
+    """
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--cache',
+            dest='cache',
+            action='store_true',
+            default=bool(os.environ.get('BL3_SAVEEDIT_CACHE')),
+            help='Cache decrypted file data to speed up future runs',
+            )
+    group.add_argument('--no-cache',
+            dest='cache',
+            action='store_false',
+            help='Do not use the decrypted file data cache',
+            )
+    parser.add_argument('--clear-cache',
+            action='store_true',
+            help='Clear out the decrypted file data cache before running',
+            )
+
+def get_cache(args, quiet=False):
+    """
+    Given the parsed `args` from a parser set up with `add_cache_args`,
+    clears the cache if requested, and returns the PayloadCache object to
+    use (or `None`, if caching is disabled).  If `quiet` is `True`, nothing
+    will be printed.
+    """
+    cache = PayloadCache()
+    if args.clear_cache:
+        removed = cache.clear()
+        if not quiet:
+            print('Cleared {} entr{} from cache at {}'.format(
+                removed,
+                'y' if removed == 1 else 'ies',
+                cache.directory,
+                ))
+    if args.cache:
+        return cache
+    else:
+        return None
+
 def export_items(items, export_file, quiet=False):
     """
     Exports the given `items` to the given text `export_file`.  If `quiet` is
@@ -84,25 +132,16 @@ def export_items_csv(items, export_file, quiet=False):
     if not quiet:
         print('Wrote {} items (in base64 format) to CSV file {}'.format(len(items), export_file))
 
-def import_items(import_file, item_create_func, item_add_func, file_csv=False, allow_fabricator=False, quiet=False):
+def _scan_import_file(import_file, file_csv=False):
     """
-    Imports items from `import_file`.  `item_create_func` should point to
-    a function used to create the item appropriately, and `item_add_func`
-    should point to a function used to actually add the item into the
-    appropriate container.  If `file_csv` is `True`, we will process the file
-    as if it's a CSV, otherwise we'll process as if it's a "regular"
-    text file.  If `allow_fabricator` is `False` (the default),
-    this routine will refuse to import Fabricators, or any item which
-    can't be decoded (in case it's a Fabricator).  If `quiet` is `True`,
-    only error/warning output will be shown.
+    Generator which yields each base64-encoded serial found in
+    `import_file`, one at a time, so that we never have to hold the whole
+    file's worth of serials in memory.  If `file_csv` is `True`, we will
+    process the file as if it's a CSV, otherwise we'll process as if it's a
+    "regular" text file.
     """
-    if not quiet:
-        print(' - Importing items from {}'.format(import_file))
-    added_count = 0
-
-    # Process the file to find serials
     looks_like_csv = False
-    serial_list = []
+    found_serial = False
     if file_csv:
         # For CSV files, we'll look for serial numbers in literally any cell
         # of the CSV
@@ -112,44 +151,112 @@ def import_items(import_file, item_create_func, item_add_func, file_csv=False, a
                 for cell in row:
                     cell = cell.strip()
                     if cell.lower().startswith('bl3(') and cell.endswith(')'):
-                        serial_list.append(cell)
+                        yield cell
     else:
         # For text files, we need the entire line to *just* be a valid serial.
         with open(import_file) as df:
             for line in df:
                 itemline = line.strip()
                 if itemline.lower().startswith('bl3(') and itemline.endswith(')'):
-                    serial_list.append(itemline)
+                    found_serial = True
+                    yield itemline
                 # Also, check to see if we might be a CSV after all, for reporting
                 # purposes.
-                if len(serial_list) == 0 and not looks_like_csv:
+                if not found_serial and not looks_like_csv:
                     if ',bl3(' in itemline.lower():
                         looks_like_csv = True
 
-    # If we didn't add any items, and the file looked like it might've been a CSV
-    # (while being processed as a text file), report that to the user, just in case.
-    if not file_csv and looks_like_csv:
+    # If the file looked like it might've been a CSV (while being processed
+    # as a text file), report that to the user, just in case.
+    if looks_like_csv:
         print('   - NOTICE: File looked like a CSV file, try adding --csv to the arguments')
 
-    # Now loop through the serials and see if we should add them
-    for serial in serial_list:
-        new_item = item_create_func(serial)
-        if not allow_fabricator:
-            # Report these regardless of `quiet`
-            if not new_item.eng_name:
-                print('   - NOTICE: Skipping unknown item import because --allow-fabricator is not set')
-                continue
-            if new_item.balance_short.lower() == 'balance_eridian_fabricator':
-                print('   - NOTICE: Skipping Fabricator import because --allow-fabricator is not set')
-                continue
-        item_add_func(new_item)
-        if not quiet:
-            if new_item.eng_name:
-                print('   + {} ({})'.format(new_item.eng_name, new_item.get_level_eng()))
-            else:
-                print('   + unknown item')
-        added_count += 1
+def import_items(import_file, datawrapper, items_create_func, items_add_func,
+        file_csv=False, allow_fabricator=False, allow_duplicates=False, quiet=False,
+        existing_serials=None, batch_size=1000):
+    """
+    Imports items from `import_file`.  `items_create_func` should point to
+    a function which takes a list of binary serials, plus a matching list
+    of `datalib.BL3Serial` objects we've already made from them (so they
+    don't get decrypted and parsed twice), and creates the items appropriately,
+    and `items_add_func` should point to a function used to actually add a
+    list of those items into the appropriate container.
+    `datawrapper` is the DataWrapper object used to look into the items
+    as they're read.  If `file_csv` is `True`, we will process the file
+    as if it's a CSV, otherwise we'll process as if it's a "regular"
+    text file.  If `allow_fabricator` is `False` (the default),
+    this routine will refuse to import Fabricators, or any item which
+    can't be decoded (in case it's a Fabricator).  Unless `allow_duplicates`
+    is `True`, items which are the same as one we've already imported
+    (regardless of their encryption seed) will be skipped, as will items
+    which match any of the binary serials in `existing_serials` (which
+    should be the items already in the container we're adding to).  If
+    `quiet` is `True`, only error/warning output will be shown.
+
+    The file is processed `batch_size` serials at a time: each batch is
+    decrypted in one go, and whatever's left after skipping duplicates and
+    Fabricators gets created and added in one go as well.
+    """
+    if not quiet:
+        print(' - Importing items from {}'.format(import_file))
+    added_count = 0
+    duplicate_count = 0
+    seen = set()
+    if existing_serials and not allow_duplicates:
+        existing_serials = list(existing_serials)
+        for (serial, decrypted) in zip(existing_serials, datalib.decrypt_serials(existing_serials)):
+            if decrypted is None:
+                try:
+                    decrypted = datalib.BL3Serial._decrypt_serial(serial)
+                except Exception:
+                    # If an existing item can't be decrypted, it can't
+                    # match anything we'd import, either.
+                    continue
+            (data, _, version) = decrypted
+            seen.add((version, bytes(data)))
+
+    serials = _scan_import_file(import_file, file_csv)
+    while True:
+        batch = [datalib.BL3Serial.decode_serial_base64(serial)
+                for serial in itertools.islice(serials, batch_size)]
+        if not batch:
+            break
+
+        # Now loop through the serials and see if we should add them
+        to_add = []
+        to_add_parsed = []
+        for (serial, decrypted) in zip(batch, datalib.decrypt_serials(batch)):
+            new_item = datalib.BL3Serial(serial, datawrapper, decrypted)
+            if not allow_duplicates:
+                # The decrypted data doesn't depend on the seed, so this'll
+                # catch the same item exported with different seeds, too.
+                item_key = (new_item.serial_version, bytes(new_item.decrypted_serial))
+                if item_key in seen:
+                    duplicate_count += 1
+                    continue
+                seen.add(item_key)
+            if not allow_fabricator:
+                # Report these regardless of `quiet`
+                if not new_item.eng_name:
+                    print('   - NOTICE: Skipping unknown item import because --allow-fabricator is not set')
+                    continue
+                if new_item.balance_short.lower() == 'balance_eridian_fabricator':
+                    print('   - NOTICE: Skipping Fabricator import because --allow-fabricator is not set')
+                    continue
+            to_add.append(serial)
+            to_add_parsed.append(new_item)
+            if not quiet:
+                if new_item.eng_name:
+                    print('   + {} ({})'.format(new_item.eng_name, new_item.get_level_eng()))
+                else:
+                    print('   + unknown item')
+            added_count += 1
+        if to_add:
+            items_add_func(items_create_func(to_add, to_add_parsed))
+
     if not quiet:
+        if duplicate_count > 0:
+            print('   - Skipped Duplicate Item Count: {}'.format(duplicate_count))
         print('   - Added Item Count: {}'.format(added_count))
 
 def update_item_levels(items, to_level, quiet=False):
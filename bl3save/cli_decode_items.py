@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+
+import io
+import os
+import re
+import sys
+import csv
+import json
+import argparse
+import itertools
+import collections
+import multiprocessing
+import bl3save
+from bl3save import datalib
+
+# Fields we report on, in order (this is also the CSV column order)
+fields = [
+        'source',
+        'line',
+        'code',
+        'error',
+        'serial_version',
+        'balance',
+        'eng_name',
+        'level',
+        'mayhem',
+        'manufacturer',
+        'parts',
+        'generic_parts',
+        ]
+
+# Finds item codes anywhere in a line, so CSVs and commented-up text
+# exports both work
+code_re = re.compile(r'bl3\([A-Za-z0-9+/=]*\)', re.IGNORECASE)
+
+# Each worker process sets this up once, so the data DBs only get loaded
+# once per worker rather than once per chunk of items.
+_datawrapper = None
+
+def _init_worker():
+    """
+    Initializer for our worker processes (and for the main process, if we're
+    not using any workers), which loads the data DBs up front.
+    """
+    global _datawrapper
+    _datawrapper = datalib.get_default_datawrapper()
+    _datawrapper.serial_db._initialize()
+    _datawrapper.name_db._initialize()
+    _datawrapper.invkey_db._initialize()
+
+def decode_code(source, line, code):
+    """
+    Decodes the `BL3()`-wrapped item `code`, found at `line` of `source`,
+    returning a dict of the fields in `fields`.  Any problem decoding the item
+    is reported in the `error` field, rather than raised.
+    """
+    record = dict.fromkeys(fields)
+    record['source'] = source
+    record['line'] = line
+    record['code'] = code
+    try:
+        item = datalib.BL3Serial(datalib.BL3Serial.decode_serial_base64(code), _datawrapper)
+        record['serial_version'] = item.serial_version
+        record['balance'] = item.balance
+        record['eng_name'] = item.eng_name
+        record['level'] = item.level
+        record['mayhem'] = item.mayhem_level
+        record['manufacturer'] = item.manufacturer
+        record['parts'] = item.parts
+        record['generic_parts'] = item.generic_parts
+    except Exception as e:
+        record['error'] = str(e) or type(e).__name__
+    return record
+
+def decode_chunk(task):
+    """
+    Decodes a chunk of item codes, for a worker.  `task` is a tuple of the
+    output format and a list of `(source, line, code)` tuples.  Returns a
+    tuple containing the formatted output for the whole chunk, the number of
+    items in it, and the number of those which couldn't be decoded.  Doing
+    the formatting in here means the main process has barely anything left
+    to do.
+    """
+    (output_format, codes) = task
+    out = io.StringIO()
+    if output_format == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+    errors = 0
+    for (source, line, code) in codes:
+        record = decode_code(source, line, code)
+        if record['error'] is not None:
+            errors += 1
+        if output_format == 'csv':
+            for key in ('parts', 'generic_parts'):
+                if record[key] is not None:
+                    record[key] = ';'.join(record[key])
+            writer.writerow([record[field] for field in fields])
+        else:
+            print(json.dumps(record), file=out)
+    return (out.getvalue(), len(codes), errors)
+
+def decode_in_pool(pool, tasks, max_pending):
+    """
+    Generator which sends each of `tasks` off to be decoded by `pool`, and
+    yields the results in the same order the tasks went out, so the output is
+    the same no matter how many workers we've got.  At most `max_pending`
+    tasks are in flight at once; the oldest result gets handed back before
+    the next task is submitted, so we never read in much more of the input
+    than the workers are actually working on.
+    """
+    pending = collections.deque()
+    for task in tasks:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(decode_chunk, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+def read_codes(paths):
+    """
+    Generator which yields a `(source, line, code)` tuple for each item code
+    found in the given `paths` (with `-` meaning stdin), in order.
+    """
+    for path in paths:
+        if path == '-':
+            df = sys.stdin
+            source = '<stdin>'
+        else:
+            df = open(path, encoding='utf-8', errors='replace')
+            source = path
+        try:
+            for (line_num, line) in enumerate(df, start=1):
+                if 'bl3(' not in line.lower():
+                    continue
+                for match in code_re.finditer(line):
+                    yield (source, line_num, match.group(0))
+        finally:
+            if df is not sys.stdin:
+                df.close()
+
+def main():
+
+    # Arguments
+    parser = argparse.ArgumentParser(
+            description='Borderlands 3 Bulk Item Code Decoder v{}'.format(bl3save.__version__),
+            )
+
+    parser.add_argument('-V', '--version',
+            action='version',
+            version='BL3 CLI SaveEdit v{}'.format(bl3save.__version__),
+            )
+
+    parser.add_argument('-f', '--format',
+            choices=['jsonl', 'csv'],
+            default='jsonl',
+            help='Output format',
+            )
+
+    parser.add_argument('-o', '--output',
+            help='File to write to (defaults to stdout)',
+            )
+
+    parser.add_argument('-j', '--jobs',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes to use (defaults to the number of CPUs)',
+            )
+
+    parser.add_argument('--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of item codes to send to a worker at once',
+            )
+
+    parser.add_argument('-q', '--quiet',
+            action='store_true',
+            help='Don\'t print a summary to stderr when finished',
+            )
+
+    parser.add_argument('paths',
+            nargs='*',
+            default=['-'],
+            metavar='path',
+            help='Files containing item codes, one or more per line (defaults to stdin, or use "-")',
+            )
+
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+
+    # Split the codes up into chunks as we read them.
+    codes = read_codes(args.paths)
+    tasks = ((args.format, chunk) for chunk in iter(lambda: list(itertools.islice(codes, args.chunk_size)), []))
+
+    if args.output:
+        odf = open(args.output, 'w', newline='')
+    else:
+        odf = sys.stdout
+    if args.format == 'csv':
+        csv.writer(odf, lineterminator='\n').writerow(fields)
+
+    # Only a couple of chunks per worker are kept in flight, so nothing gets
+    # read in much faster than the workers can keep up with.
+    total = 0
+    errors = 0
+    pool = None
+    try:
+        if args.jobs == 1:
+            _init_worker()
+            results = map(decode_chunk, tasks)
+        else:
+            pool = multiprocessing.Pool(args.jobs, initializer=_init_worker)
+            results = decode_in_pool(pool, tasks, args.jobs*2)
+        for (text, chunk_total, chunk_errors) in results:
+            odf.write(text)
+            total += chunk_total
+            errors += chunk_errors
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if odf is not sys.stdout:
+            odf.close()
+
+    if not args.quiet:
+        print('Decoded {} item codes ({} errors)'.format(total, errors), file=sys.stderr)
+
+    if errors > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
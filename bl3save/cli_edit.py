@@ -214,6 +214,12 @@ def main():
             help='Allow importing Fabricator when importing items from file',
             )
 
+    parser.add_argument('--allow-duplicates',
+            dest='allow_duplicates',
+            action='store_true',
+            help='Allow importing items which are duplicates of others in the file or inventory',
+            )
+
     parser.add_argument('--delete-pt1-mission',
             type=str,
             metavar='MISSIONPATH',
@@ -569,11 +575,14 @@ def main():
         # Import Items
         if args.import_items:
             cli_common.import_items(args.import_items,
-                    save.create_new_item_encoded,
-                    save.add_item,
+                    save.datawrapper,
+                    save.create_new_items,
+                    save.add_items,
                     file_csv=args.csv,
                     allow_fabricator=args.allow_fabricator,
+                    allow_duplicates=args.allow_duplicates,
                     quiet=args.quiet,
+                    existing_serials=save.get_item_serials(),
                     )
 
         # Setting item levels.  Keep in mind that we'll want to do this *after*
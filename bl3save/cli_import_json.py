@@ -69,7 +69,7 @@ def main():
     # Load the JSON file and import (so we know it's valid before
     # we ask for confirmation)
     with open(args.json, 'rt') as df:
-        save_file.import_json(df.read())
+        save_file.import_json_file(df)
 
     # Ask for confirmation
     if not args.clobber:
@@ -24,6 +24,7 @@
 import bl3save
 import argparse
 import itertools
+from . import cli_common
 from bl3save.bl3save import BL3Save
 
 def main():
@@ -67,14 +68,17 @@ def main():
             action='store_true',
             help='Show all unlocked Fast Travel stations')
 
+    cli_common.add_cache_args(parser)
+
     parser.add_argument('filename',
             help='Filename to process',
             )
 
     args = parser.parse_args()
+    cache = cli_common.get_cache(args)
 
     # Load the save
-    save = BL3Save(args.filename)
+    save = BL3Save(args.filename, cache=cache)
 
     # Character name
     print('Character: {}'.format(save.get_char_name()))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+import os
+import sys
+import csv
+import argparse
+import bl3save
+from bl3save.bl3save import BL3Save
+
+# Columns for CSV output, in order
+csv_fields = [
+        'filename',
+        'char_name',
+        'class',
+        'level',
+        'xp',
+        'playthroughs_completed',
+        'savegame_id',
+        'savegame_guid',
+        ]
+
+def find_saves(paths, recursive=False):
+    """
+    Generator which yields savegame filenames from the given list of `paths`,
+    as tuples of the filename and whether it was given to us explicitly.
+    Files are yielded as-is, and directories are searched for `*.sav` files
+    (descending into subdirectories if `recursive` is `True`).
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield (path, True)
+            continue
+        if recursive:
+            walker = os.walk(path)
+        else:
+            walker = [(path, [], os.listdir(path))]
+        for dirpath, dirnames, filenames in walker:
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if not filename.endswith('.sav'):
+                    continue
+                yield (os.path.join(dirpath, filename), False)
+
+def main():
+
+    # Arguments
+    parser = argparse.ArgumentParser(
+            description='Borderlands 3 Savegame Lister v{}'.format(bl3save.__version__),
+            )
+
+    parser.add_argument('-V', '--version',
+            action='version',
+            version='BL3 CLI SaveEdit v{}'.format(bl3save.__version__),
+            )
+
+    parser.add_argument('-r', '--recursive',
+            action='store_true',
+            help='Search directories recursively',
+            )
+
+    parser.add_argument('-c', '--csv',
+            action='store_true',
+            help='Output in CSV format',
+            )
+
+    parser.add_argument('paths',
+            nargs='*',
+            default=['.'],
+            metavar='path',
+            help='Savegame files, or directories containing savegames (defaults to the current directory)',
+            )
+
+    args = parser.parse_args()
+
+    if args.csv:
+        writer = csv.DictWriter(sys.stdout, fieldnames=csv_fields)
+        writer.writeheader()
+
+    # Each save is opened lazily, so `get_summary` can decide whether it's
+    # quicker to parse the whole thing or just pick out the handful of fields
+    # we report on (see `BL3Save.summary_scan_max_len`).  Profiles found
+    # in directories are skipped (that's just a header check, so it's cheap),
+    # but we'll complain about any which were specified explicitly.
+    errors = 0
+    for (filename, explicit) in find_saves(args.paths, args.recursive):
+        try:
+            if bl3save.get_file_class(filename) is not BL3Save:
+                if not explicit:
+                    continue
+                raise Exception('File is a profile, not a savegame')
+            summary = BL3Save(filename, lazy=True).get_summary(True)
+        except Exception as e:
+            print('{}: ERROR: {}'.format(filename, str(e) or type(e).__name__), file=sys.stderr)
+            errors += 1
+            continue
+        if args.csv:
+            writer.writerow(dict(summary, filename=filename))
+        else:
+            if summary['playthroughs_completed'] == 1:
+                plural = ''
+            else:
+                plural = 's'
+            print('{}: {} - Level {} {} ({} playthrough{} completed)'.format(
+                filename,
+                summary['char_name'],
+                summary['level'],
+                summary['class'] or 'Unknown Class',
+                summary['playthroughs_completed'],
+                plural,
+                ))
+
+    if errors > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -208,6 +208,12 @@ def main():
             help='Allow importing Fabricator when importing items from file',
             )
 
+    parser.add_argument('--allow-duplicates',
+            dest='allow_duplicates',
+            action='store_true',
+            help='Allow importing items which are duplicates of others in the file or bank',
+            )
+
     parser.add_argument('--clear-customizations',
             dest='clear_customizations',
             action='store_true',
@@ -542,11 +548,14 @@ def main():
         # Import Items
         if args.import_items:
             cli_common.import_items(args.import_items,
-                    profile.create_new_item_encoded,
-                    profile.add_bank_item,
+                    profile.datawrapper,
+                    profile.create_new_items,
+                    profile.add_bank_items,
                     file_csv=args.csv,
                     allow_fabricator=args.allow_fabricator,
+                    allow_duplicates=args.allow_duplicates,
                     quiet=args.quiet,
+                    existing_serials=profile.get_bank_item_serials(),
                     )
 
         # Setting item levels.  Keep in mind that we'll want to do this *after*
@@ -24,6 +24,7 @@
 import bl3save
 import argparse
 import itertools
+from . import cli_common
 from bl3save.bl3profile import BL3Profile
 
 def main():
@@ -48,14 +49,17 @@ def main():
             help='Show inventory items',
             )
 
+    cli_common.add_cache_args(parser)
+
     parser.add_argument('filename',
             help='Filename to process',
             )
 
     args = parser.parse_args()
+    cache = cli_common.get_cache(args)
 
     # Load the profile
-    prof = BL3Profile(args.filename)
+    prof = BL3Profile(args.filename, cache=cache)
 
     # Golden Keys
     print('Keys:')
@@ -22,40 +22,55 @@
 # 3. This notice may not be removed or altered from any source distribution.
 
 import io
+import sys
+import pathlib
+import hashlib
+import threading
 import json
 import lzma
 import struct
 import base64
 import random
+import array
 import binascii
+import collections
+import contextlib
 import importlib.resources
 
+# NumPy is entirely optional; if it's around we'll use it for decrypting
+# serials in bulk.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from . import *
+from . import serialdb
+from .cache import ResourceCache
 
 class ArbitraryBits(object):
     """
-    Ridiculous little object to deal with variable-bit-length packed data that
-    we find inside item serial numbers.  This is super-inefficient on the
-    large scale, but given that we're likely to only be dealing with hundreds of
-    items at the absolute most (and more likely only dozens), it probably doesn't
-    matter.
-
-    Rather than doing clever things with bitwise operations and shifting data
-    around, we're convering all the data into a string where each letter is a
-    0 or 1, so we can just use regular Python indexing and slicing to do whatever
-    we want with them.  A call to `int(data, 2)` on the string (or a bit of the
-    string) will convert it back into a number for us.
-
-    Many bits of data will span byte boundaries, and to properly handle the way
-    they're packed, we're actually storing the data in backwards chunks of 8
-    bits.  So when we mention the "front" of the data, we'll actually end up
-    looking at the *end* of our internally-stored data, and vice-versa.  "Front"
-    and "back" are used as if you're looking at the actual binary representation,
-    not our own janky internal model.
+    Little object to deal with variable-bit-length packed data that we find
+    inside item serial numbers.
+
+    The data is stored as one big Python int, along with a count of how many
+    bits it holds, and we just shift and mask to get at whatever we want.
+    Many bits of data will span byte boundaries, and to properly handle the
+    way they're packed, the int is built from the data in little-endian byte
+    order, and values are read from the low end of it.  So the "front" of the
+    data is the *least* significant bits of our int, and the "back" is the
+    most significant.  "Front" and "back" are used as if you're looking at the
+    actual binary representation, not our own internal model.
     """
 
+    __slots__ = ('value', 'length')
+
     def __init__(self, data=b''):
-        self.data = ''.join([f'{d:08b}' for d in reversed(data)])
+        self.value = int.from_bytes(data, 'little')
+        self.length = len(data)*8
+
+    def __len__(self):
+        return self.length
 
     def eat(self, bits):
         """
@@ -63,43 +78,114 @@ class ArbitraryBits(object):
         data and returns the value.  This is destructive; the data
         eaten off the front will no longer be in the data.
         """
-        if bits > len(self.data):
-            raise Exception('Attempted to read {} bits, but only {} remain'.format(bits, len(self.data)))
-        val = int(self.data[-bits:], 2)
-        self.data = self.data[:-bits]
+        if bits > self.length:
+            raise Exception('Attempted to read {} bits, but only {} remain'.format(bits, self.length))
+        val = self.value & ((1 << bits) - 1)
+        self.value >>= bits
+        self.length -= bits
         return val
 
     def append_value(self, value, bits):
         """
         Feeds the given `value` to the end of the data, using the given
         number of `bits` to do so.  We're assuming that `value` is
-        an unsigned number.
+        an unsigned 32-bit number; any bits past the ones we've been
+        told to use are dropped.
         """
-        value_data = struct.pack('>I', value)
-        value_txt = ''.join([f'{d:08b}' for d in value_data])
-        self.data = value_txt[-bits:] + self.data
+        if not isinstance(value, int) or value < 0 or value > 0xFFFFFFFF:
+            raise Exception('Value {} is not an unsigned 32-bit number'.format(value))
+        bits = min(bits, 32)
+        self.value |= (value & ((1 << bits) - 1)) << self.length
+        self.length += bits
 
     def append_data(self, new_data):
         """
-        Appends the given `new_data` (from another ArbitraryBits object)
-        to the end of our data.
+        Appends the given `new_data` (another ArbitraryBits object) to the
+        end of our data.
         """
-        self.data = new_data + self.data
+        self.value |= new_data.value << self.length
+        self.length += new_data.length
+
+    def copy(self):
+        """
+        Returns a new ArbitraryBits object holding the same data as us
+        """
+        new_bits = ArbitraryBits()
+        new_bits.value = self.value
+        new_bits.length = self.length
+        return new_bits
 
     def get_data(self):
         """
-        Returns our current data in binary format.  Will bad the end with
+        Returns our current data in binary format.  Will pad the end with
         `0` bits if we're not a multiple of 8.
         """
-        # Pad with 0s if need be
-        need_bits = (8-len(self.data)) % 8
-        temp_data = '0'*need_bits + self.data
+        return bytearray(self.value.to_bytes((self.length+7)//8, 'little'))
+
+class KeystreamCache(object):
+    """
+    Bounded LRU cache of the XOR keystreams used to obfuscate item serials.
+    The keystream only depends on the seed (and how much of it we need), and
+    in practice we only see a handful of distinct seeds, so there's no point
+    in running the generator byte-by-byte for every single serial.  `hits`
+    and `misses` keep a running count of how effective the cache is being.
+    Since `BL3Serial` shares one of these between all its instances, access
+    is protected by a lock so that it can be used from multiple threads.
+    """
 
-        # Now convert back to an actual bytearray
-        byte_data = []
-        for i in range(int(len(temp_data)/8)-1, -1, -1):
-            byte_data.append(int(temp_data[i*8:(i*8)+8], 2))
-        return bytearray(byte_data)
+    default_max_seeds = 1024
+
+    def __init__(self, max_seeds=None):
+        if max_seeds is None:
+            max_seeds = self.default_max_seeds
+        self.max_seeds = max_seeds
+        self.hits = 0
+        self.misses = 0
+        self.streams = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, seed, length):
+        """
+        Returns at least `length` bytes of keystream for the given `seed`
+        """
+        with self._lock:
+            entry = self.streams.get(seed)
+            if entry is not None and len(entry[0]) >= length:
+                self.hits += 1
+                self.streams.move_to_end(seed)
+                return entry[0]
+            self.misses += 1
+
+            # Either start from scratch, or carry on from where we left off
+            # last time, if we've seen this seed before.
+            if entry is None:
+                keystream = b''
+                # Because our seed can be negative, we do have to do the
+                # & here, even though it might not seem to make sense to
+                # do so.
+                xor = (seed >> 5) & 0xFFFFFFFF
+            else:
+                (keystream, xor) = entry
+            more = bytearray()
+            for _ in range(length - len(keystream)):
+                xor = (xor * 0x10A860C1) % 0xFFFFFFFB
+                more.append(xor & 0xFF)
+            keystream += more
+
+            self.streams[seed] = (keystream, xor)
+            self.streams.move_to_end(seed)
+            while len(self.streams) > self.max_seeds:
+                self.streams.popitem(last=False)
+            return keystream
+
+    def clear(self):
+        """
+        Empties the cache and resets our counters
+        """
+        with self._lock:
+            self.streams.clear()
+            self.hits = 0
+            self.misses = 0
 
 class BL3Serial(object):
     """
@@ -107,13 +193,46 @@ class BL3Serial(object):
     numbers.
     """
 
-    def __init__(self, serial, datawrapper):
+    # Shared by all serials; see `KeystreamCache`
+    keystreams = KeystreamCache()
+
+    # We can end up with many thousands of these, so skip the per-instance
+    # `__dict__`.  Subclasses should define their own `__slots__` as well.
+    __slots__ = (
+            'datawrapper', '_edit_depth', '_edit_pending', '_serial', '_encoded',
+            'decrypted_serial', 'orig_seed', 'serial_version',
+            'parsed', 'parts_parsed', 'can_parse', 'can_parse_parts', 'changed_parts',
+            '_version', '_balance_bits', '_balance_idx', '_balance', '_balance_short',
+            '_eng_name', '_invdata_bits', '_invdata_idx', '_invdata',
+            '_manufacturer_bits', '_manufacturer_idx', '_manufacturer',
+            '_level', '_rerolled', '_remaining_data',
+            '_part_invkey', '_part_bits', '_parts', '_generic_bits', '_generic_parts',
+            '_additional_data', '_num_customs',
+            )
+
+    # Everything `set_serial` fills in (or that gets filled in by parsing),
+    # which can be taken on from another BL3Serial with the same serial
+    _serial_state = tuple(attr for attr in __slots__
+            if attr not in ('datawrapper', '_edit_depth', '_edit_pending', '_serial', '_encoded'))
+
+    def __init__(self, serial, datawrapper, decrypted=None):
 
         self.datawrapper = datawrapper
-        self.serial_db = datawrapper.serial_db
-        self.name_db = datawrapper.name_db
-        self.invkey_db = datawrapper.invkey_db
-        self.set_serial(serial)
+        self._edit_depth = 0
+        self._edit_pending = False
+        self.set_serial(serial, decrypted)
+
+    @property
+    def serial_db(self):
+        return self.datawrapper.serial_db
+
+    @property
+    def name_db(self):
+        return self.datawrapper.name_db
+
+    @property
+    def invkey_db(self):
+        return self.datawrapper.invkey_db
 
     def _update_superclass_serial(self):
         """
@@ -123,13 +242,35 @@ class BL3Serial(object):
         """
         pass
 
-    def set_serial(self, serial):
+    @property
+    def serial(self):
         """
-        Sets our serial number
+        Returns our binary serial number, as stored in the savegame/profile.
+        After an edit, this will be the re-encoded serial (using a seed of `0`).
         """
+        return self._serial
 
-        self.serial = serial
-        (self.decrypted_serial, self.orig_seed, self.serial_version) = BL3Serial._decrypt_serial(serial)
+    def set_serial(self, serial, decrypted=None):
+        """
+        Sets our serial number.  If `decrypted` is passed in, it should be the
+        result of decrypting the serial already (as returned by
+        `_decrypt_serial` or `decrypt_serials`), so we don't have to do it
+        again.  It can also be another BL3Serial made from this same serial,
+        in which case we take on everything it's already parsed, too.
+        """
+
+        self._serial = serial
+        self._encoded = None
+        if isinstance(decrypted, BL3Serial):
+            # None of this gets modified in place (edits always replace
+            # it), so it's fine to share with the other object.
+            for attr in BL3Serial._serial_state:
+                setattr(self, attr, getattr(decrypted, attr))
+            self._update_superclass_serial()
+            return
+        if decrypted is None:
+            decrypted = BL3Serial._decrypt_serial(serial)
+        (self.decrypted_serial, self.orig_seed, self.serial_version) = decrypted
         self.parsed = False
         self.parts_parsed = False
         self.can_parse = True
@@ -175,17 +316,13 @@ class BL3Serial(object):
         # If the seed is 0, we basically don't do anything (though
         # make sure we return the same datatype as below)
         if seed == 0:
-            return [d for d in data]
-
-        # Because our seed can be negative, we do have to do the
-        # & here, even though it might not seem to make sense to
-        # do so.
-        xor = (seed >> 5) & 0xFFFFFFFF
-        temp = []
-        for i, d in enumerate(data):
-            xor = (xor * 0x10A860C1) % 0xFFFFFFFB
-            temp.append((d ^ xor) & 0xFF)
-        return temp
+            return bytearray(data)
+
+        # XOR the whole thing in one go, treating both the data and the
+        # keystream as big ints.
+        length = len(data)
+        keystream = BL3Serial.keystreams.get(seed, length)
+        return bytearray((int.from_bytes(data, 'big') ^ int.from_bytes(keystream[:length], 'big')).to_bytes(length, 'big'))
 
     @staticmethod
     def _bogodecrypt(data, seed):
@@ -198,7 +335,7 @@ class BL3Serial(object):
 
         # Now rotate the data
         steps = (seed & 0x1F) % len(data)
-        return bytearray(temp[-steps:] + temp[:-steps])
+        return temp[-steps:] + temp[:-steps]
 
     @staticmethod
     def _bogoencrypt(data, seed):
@@ -211,7 +348,7 @@ class BL3Serial(object):
         rotated = bytearray(data[steps:] + data[:steps])
 
         # Then run through the xor stuff
-        return bytearray(BL3Serial._xor_data(rotated, seed))
+        return BL3Serial._xor_data(rotated, seed)
 
     @staticmethod
     def _decrypt_serial(serial):
@@ -300,11 +437,7 @@ class BL3Serial(object):
         parts = []
         num_parts = bits.eat(count_bits)
         for _ in range(num_parts):
-            part_idx = bits.eat(num_bits)
-            part_val = self.serial_db.get_part(category, part_idx)
-            if not part_val:
-                part_val = 'unknown'
-            parts.append((part_val, part_idx))
+            parts.append(self.serial_db.get_part_entry(category, bits.eat(num_bits)))
         return (num_bits, parts)
 
     def _parse_serial(self):
@@ -316,6 +449,13 @@ class BL3Serial(object):
         if not self.can_parse:
             return
 
+        # If something wants a re-parse partway through an `edit()` block,
+        # write out the changes we've collected so far first, so that they
+        # don't get lost.
+        if self._edit_pending:
+            self._edit_pending = False
+            self._deparse_serial()
+
         bits = ArbitraryBits(self.decrypted_serial)
 
         # First value should always be 128, apparently
@@ -353,7 +493,7 @@ class BL3Serial(object):
         # Make a note of our remaining data - if we re-save without any parts
         # changes, we can just use this rather than reconstructing the whole
         # serial.
-        self._remaining_data = bits.data
+        self._remaining_data = bits.copy()
 
         # Now let's see if we can parse parts
         self._part_invkey = self.invkey_db.get(self._balance)
@@ -399,11 +539,11 @@ class BL3Serial(object):
             # And read in our remaining data.  If there's more than 7 bits
             # left, we've done something wrong, because it should only be
             # zero-padding after all the "real" data is in place.
-            if len(bits.data) > 7:
+            if len(bits) > 7:
                 self.parts_parsed = False
                 self.can_parse_parts = False
                 pass
-            elif '1' in bits.data:
+            elif bits.value != 0:
                 # This is supposed to only be zero-padding at the moment, if
                 # we see something else, abort
                 self.parts_parsed = False
@@ -415,14 +555,15 @@ class BL3Serial(object):
     def _deparse_serial(self):
         """
         De-parses a serial; used after we make changes to the data that gets
-        pulled out during `_parse_serial`.  At the moment, that's both level
-        changes and mayhem level changes.  Will end up calling out to the
+        pulled out during `_parse_serial`.  At the moment, that's level,
+        mayhem level, and anointment changes.  Will end up calling out to the
         superclass's `_update_superclass_serial` to propagate the serial change
-        to whatever containing structure needs it, and set the object to trigger a
-        re-parse if anything else needs to read more.  That's probably overkill
-        and makes this technically quite inefficient, especially when making
-        multiple edits to the same item, but given the scale of processing,
-        we'll probably be fine.
+        to whatever containing structure needs it.
+
+        Since we already know everything that went into the new serial, we
+        hang on to all our parsed data rather than parsing it all over again,
+        unless some value didn't fit into the number of bits available for it
+        (in which case a re-parse will show what actually got stored).
         """
 
         if not self.can_parse:
@@ -443,55 +584,125 @@ class BL3Serial(object):
             self._generic_bits = self.serial_db.get_num_bits('InventoryGenericPartData', self._version)
 
         # Construct a new header
-        bits = ArbitraryBits()
-        bits.append_value(128, 8)
-        bits.append_value(self._version, 7)
-        bits.append_value(self._balance_idx, self._balance_bits)
-        bits.append_value(self._invdata_idx, self._invdata_bits)
-        bits.append_value(self._manufacturer_idx, self._manufacturer_bits)
-        bits.append_value(self._level, 7)
+        header = [
+                (128, 8),
+                (self._version, 7),
+                (self._balance_idx, self._balance_bits),
+                (self._invdata_idx, self._invdata_bits),
+                (self._manufacturer_idx, self._manufacturer_bits),
+                (self._level, 7),
+                ]
 
         # Arguably we should *always* re-encode parts, if we're able to, just so this
         # function is less complex.  For now I'm keeping it like this, though.
 
         if self.changed_parts:
             # If we've changed parts, just write out everything again.  First parts
-            bits.append_value(len(self._parts), 6)
+            body = [(len(self._parts), 6)]
             for (part_val, part_idx) in self._parts:
-                bits.append_value(part_idx, self._part_bits)
+                body.append((part_idx, self._part_bits))
 
             # Then generics
-            bits.append_value(len(self._generic_parts), 4)
+            body.append((len(self._generic_parts), 4))
             for (part_val, part_idx) in self._generic_parts:
-                bits.append_value(part_idx, self._generic_bits)
+                body.append((part_idx, self._generic_bits))
 
             # Then additional data
-            bits.append_value(len(self._additional_data), 8)
+            body.append((len(self._additional_data), 8))
             for value in self._additional_data:
-                bits.append_value(value, 8)
+                body.append((value, 8))
 
             # Then our number of customs (should always be zero)
-            bits.append_value(self._num_customs, 4)
+            body.append((self._num_customs, 4))
 
             # Then, if we're a v4 serial, the number of times we've been rerolled
             if self.serial_version >= 4:
-                bits.append_value(self._rerolled, 8)
+                body.append((self._rerolled, 8))
+        else:
+            body = []
 
+        # Pack it all up, keeping an eye out for anything that doesn't fit
+        keep_state = True
+        bits = ArbitraryBits()
+        for (value, num_bits) in header:
+            bits.append_value(value, num_bits)
+            if value >> num_bits:
+                keep_state = False
+        remaining = ArbitraryBits()
+        for (value, num_bits) in body:
+            remaining.append_value(value, num_bits)
+            if value >> num_bits:
+                keep_state = False
+        if self.changed_parts:
+            # Account for the zero-padding at the end, just like a fresh
+            # parse would see it.
+            remaining.length += -(len(bits) + len(remaining)) % 8
         else:
             # Otherwise, we can re-use our original remaining data
-            bits.append_data(self._remaining_data)
+            remaining = self._remaining_data
+        bits.append_data(remaining)
 
         # Read the serial back out of our structure
         new_data = bits.get_data()
 
-        # Encode the new serial (using seed 0; unencrypted)
-        new_serial = BL3Serial._encrypt_serial(new_data, self.serial_version, 0)
+        # If reading parts blew up partway through the last parse, our parsed
+        # data is incomplete, so we'd better not hang on to it.  (`_rerolled`
+        # is the very last thing to get read.)
+        if self._part_invkey is not None and self._rerolled is None:
+            keep_state = False
+
+        if keep_state:
+            # Install the new data directly.  With a seed of 0 the "encrypted"
+            # serial is just our data as-is, so there's no need to decrypt
+            # anything (or re-parse it) afterwards.
+            self._encoded = None
+            self.decrypted_serial = new_data
+            self.orig_seed = 0
+            self._serial = self.get_serial_number()
+            self.changed_parts = False
+            self._remaining_data = remaining.copy()
+            self._update_superclass_serial()
+        else:
+            # Load in the new serial (this will set `parsed` to `False`)
+            new_serial = BL3Serial._encrypt_serial(new_data, self.serial_version, 0)
+            self.set_serial(new_serial, (bytearray(new_data), 0, self.serial_version))
 
-        # Load in the new serial (this will set `parsed` to `False`)
-        # It bothers me that I've just done an `_encrypt_serial` in the
-        # previous statement, when this call to `set_serial` will just
-        # turn right around and decrypt it again.  Alas.
-        self.set_serial(new_serial)
+    def _serial_changed(self):
+        """
+        Called by our setters after they've changed any of our parsed data.
+        Re-encodes the serial right away, unless we're inside an `edit()`
+        block, in which case that'll wait until the block is done.
+        """
+        if self._edit_depth > 0:
+            self._edit_pending = True
+        else:
+            self._deparse_serial()
+
+    @contextlib.contextmanager
+    def edit(self):
+        """
+        Context manager to make several changes to an item at once, such as:
+
+            with item.edit():
+                item.level = 72
+                item.mayhem_level = 10
+                item.set_anointment(anointment)
+
+        Normally each of those would re-encode the serial (and update any
+        containing structure) on its own, but inside the block the changes
+        are just collected up, and the serial gets re-encoded once, when the
+        block exits.  Until then, `get_serial_number` and friends will return
+        the serial as it was before the block started.  Blocks can be nested;
+        only the outermost one triggers the re-encode.
+        """
+        self._edit_depth += 1
+        try:
+            yield self
+        finally:
+            self._edit_depth -= 1
+            if self._edit_depth == 0 and self._edit_pending:
+                self._edit_pending = False
+                self._deparse_serial()
 
     @property
     def balance(self):
@@ -515,6 +726,41 @@ class BL3Serial(object):
                 return None
         return self._balance_short
 
+    @property
+    def manufacturer(self):
+        """
+        Returns the manufacturer for this item
+        """
+        if not self.parsed:
+            self._parse_serial()
+            if not self.can_parse:
+                return None
+        return self._manufacturer
+
+    @property
+    def parts(self):
+        """
+        Returns a list of the part names on this item, or `None` if we
+        couldn't parse the item's parts
+        """
+        if not self.parsed or not self.parts_parsed:
+            self._parse_serial()
+            if not self.can_parse or not self.can_parse_parts:
+                return None
+        return [part_name for (part_name, part_idx) in self._parts]
+
+    @property
+    def generic_parts(self):
+        """
+        Returns a list of the generic part names on this item (anointments
+        and Mayhem levels), or `None` if we couldn't parse the item's parts
+        """
+        if not self.parsed or not self.parts_parsed:
+            self._parse_serial()
+            if not self.can_parse or not self.can_parse_parts:
+                return None
+        return [part_name for (part_name, part_idx) in self._generic_parts]
+
     @property
     def eng_name(self):
         """
@@ -557,29 +803,39 @@ class BL3Serial(object):
 
         # Set the level and trigger a re-encode of the serial
         self._level = value
-        self._deparse_serial()
-        self._update_superclass_serial()
+        self._serial_changed()
 
     def get_serial_number(self, orig_seed=False):
         """
         Returns the binary item serial number.  If `orig_seed` is `True`, the
         serial number will use the same seed that was used in the savegame.
         Otherwise, it will use a seed of `0`, which will then be unencrypted.
-        """
-        if orig_seed:
-            seed = self.orig_seed
-        else:
-            seed = 0
-        return BL3Serial._encrypt_serial(self.decrypted_serial, self.serial_version, seed)
+        The result is remembered until our serial changes.
+        """
+        key = ('bin', bool(orig_seed))
+        if self._encoded is None:
+            self._encoded = {}
+        if key not in self._encoded:
+            if orig_seed:
+                seed = self.orig_seed
+            else:
+                seed = 0
+            self._encoded[key] = BL3Serial._encrypt_serial(self.decrypted_serial, self.serial_version, seed)
+        return self._encoded[key]
 
     def get_serial_base64(self, orig_seed=False):
         """
         Returns the base64-encoded item serial number.  If `orig_seed` is
         `True`, the serial number will use the same seed that was used in the
         savegame.  Otherwise, it will use a seed of `0`, which will then be
-        unencrypted.
+        unencrypted.  The result is remembered until our serial changes.
         """
-        return 'BL3({})'.format(base64.b64encode(self.get_serial_number(orig_seed)).decode('latin1'))
+        key = ('b64', bool(orig_seed))
+        if self._encoded is None:
+            self._encoded = {}
+        if key not in self._encoded:
+            self._encoded[key] = 'BL3({})'.format(base64.b64encode(self.get_serial_number(orig_seed)).decode('latin1'))
+        return self._encoded[key]
 
     @staticmethod
     def decode_serial_base64(new_data):
@@ -672,8 +928,7 @@ class BL3Serial(object):
         self._generic_parts = new_parts
 
         # Re-serialize
-        self._deparse_serial()
-        self._update_superclass_serial()
+        self._serial_changed()
 
         # return!
         return True
@@ -726,8 +981,7 @@ class BL3Serial(object):
         self._generic_parts = new_parts
 
         # Re-serialize
-        self._deparse_serial()
-        self._update_superclass_serial()
+        self._serial_changed()
 
         # return!
         return True
@@ -752,33 +1006,378 @@ class BL3Serial(object):
         else:
             return to_ret
 
+def decrypt_serials(serials):
+    """
+    Decrypts a whole list of binary `serials` at once, which is quite a bit
+    quicker than doing them one at a time when there's a lot of them (such as
+    a profile's bank).  Returns a list containing, for each serial, the same
+    tuple that `BL3Serial._decrypt_serial` would, which can be passed in to
+    `BL3Serial` as `decrypted`.  Any serial which doesn't decrypt properly
+    gets `None` instead, so that decrypting it the usual way will raise the
+    appropriate exception whenever that item's actually created.
+    """
+    if numpy is None or len(serials) < 16:
+        results = []
+        for serial in serials:
+            try:
+                results.append(BL3Serial._decrypt_serial(serial))
+            except Exception:
+                results.append(None)
+        return results
+
+    # Figure out the seed for each valid-looking serial, and group them up by
+    # length, so that each group can be processed as one two-dimensional array.
+    # Anything too short to even hold its two-byte CRC gets left as `None`.
+    results = [None]*len(serials)
+    seed_list = [0]*len(serials)
+    by_length = {}
+    for idx, serial in enumerate(serials):
+        if len(serial) >= 7 and (serial[0] == 3 or serial[0] == 4):
+            seed_list[idx] = int.from_bytes(serial[1:5], 'big', signed=True)
+            by_length.setdefault(len(serial)-5, []).append(idx)
+    if not by_length:
+        return results
+    seeds = numpy.array(seed_list, dtype=numpy.int64)
+
+    # Generate keystreams for every distinct seed in parallel.  Products stay
+    # under 2**61, so there's no overflow to worry about.  A seed of 0 ends up
+    # with a keystream of all zeroes, which is just what we want.
+    (unique_seeds, seed_rows) = numpy.unique(seeds, return_inverse=True)
+    state = ((unique_seeds >> 5) & 0xFFFFFFFF).astype(numpy.uint64)
+    max_length = max(by_length.keys())
+    keystreams = numpy.empty((len(unique_seeds), max_length), dtype=numpy.uint8)
+    for i in range(max_length):
+        state = (state * 0x10A860C1) % 0xFFFFFFFB
+        keystreams[:, i] = state & 0xFF
+
+    for length, indexes in by_length.items():
+        indexes = numpy.array(indexes)
+        data = numpy.frombuffer(b''.join([serials[idx][5:] for idx in indexes]),
+                dtype=numpy.uint8).reshape(-1, length)
+        temp = data ^ keystreams[seed_rows[indexes], :length]
+
+        # Now rotate each row by its own number of steps
+        steps = (seeds[indexes] & 0x1F) % length
+        columns = (numpy.arange(length) - steps[:, None]) % length
+        decrypted = numpy.take_along_axis(temp, columns, axis=1).tobytes()
+
+        # Finally, check all the CRCs
+        start = 0
+        for idx in indexes.tolist():
+            serial = serials[idx]
+            computed_crc = binascii.crc32(decrypted[start+2:start+length],
+                    binascii.crc32(b"\xFF\xFF", binascii.crc32(serial[:5])))
+            if int.from_bytes(decrypted[start:start+2], 'big') == ((computed_crc >> 16) ^ computed_crc) & 0xFFFF:
+                results[idx] = (bytearray(decrypted[start+2:start+length]), seed_list[idx], serial[0])
+            start += length
+
+    return results
+
+class ItemTable(object):
+    """
+    Column-oriented table of decoded item headers, for when we want to slice
+    and dice a whole lot of items at once (a profile bank, or the combined
+    inventories of a pile of savegames) without having to create a
+    `BL3Serial` object for every one of them.  Build one from a list of
+    binary serials:
+
+        table = ItemTable(profile.prof.bank_inventory_list, datawrapper)
+
+    Each of the names in `columns` is available as `table[name]`, which is a
+    NumPy array if NumPy is installed, or an `array.array` otherwise.  Values
+    which couldn't be parsed are stored as `-1` (so any serial which couldn't
+    be decrypted at all will have `-1` for everything but its index), and
+    `mayhem` is `-1` when we couldn't parse the item's parts.
+
+    `filter`, `sort`, and `group_by` all return new tables, so they can be
+    chained.  With NumPy around, masks for `filter` can be built directly from
+    the columns, so "all items under level 72, by manufacturer" is just:
+
+        table.filter(table['level'] < 72).group_by('manufacturer_idx')
+
+    Without NumPy, pass in any sequence of true/false values instead, such as
+    `[level < 72 for level in table['level']]`.
+    """
+
+    columns = (
+            'index',
+            'serial_version',
+            'version',
+            'balance_idx',
+            'invdata_idx',
+            'manufacturer_idx',
+            'level',
+            'mayhem',
+            'parts_parsed',
+            )
+
+    # Which columns can be turned into names, and the InventorySerialDB
+    # category to use for them
+    name_categories = {
+            'balance_idx': 'InventoryBalanceData',
+            'invdata_idx': 'InventoryData',
+            'manufacturer_idx': 'ManufacturerData',
+            }
+
+    def __init__(self, serials, datawrapper, _rows=None):
+        self.datawrapper = datawrapper
+        if _rows is not None:
+            # Internal use only; `_rows` is a tuple of the serials and
+            # decrypted serials we share with the table we came from, and
+            # our own column data.  The `index` column points into the
+            # shared lists.
+            (self.serials, self.decrypted, self.data) = _rows
+            return
+
+        self.serials = list(serials)
+        self.decrypted = decrypt_serials(self.serials)
+        rows = []
+        for (idx, decrypted) in enumerate(self.decrypted):
+            if decrypted is None:
+                rows.append((idx, -1, -1, -1, -1, -1, -1, -1, 0))
+            else:
+                rows.append((idx, decrypted[2]) + ItemTable._scan(decrypted[0], decrypted[2], datawrapper))
+        self.data = {}
+        for (col_idx, name) in enumerate(self.columns):
+            self.data[name] = ItemTable._make_column([row[col_idx] for row in rows])
+
+    @staticmethod
+    def _make_column(values):
+        """
+        Creates a column from the given list of int `values`
+        """
+        if numpy is not None:
+            return numpy.array(values, dtype=numpy.int32)
+        else:
+            return array.array('i', values)
+
+    @staticmethod
+    def _scan(data, serial_version, datawrapper):
+        """
+        Reads the header info out of the given decrypted serial `data`
+        (from a serial with version `serial_version`),
+        returning a tuple of the version, balance, inventory data and
+        manufacturer indexes, level, mayhem level, and whether we could parse
+        the parts.  This follows along with `BL3Serial._parse_serial`, just
+        without hanging on to anything we don't need.
+        """
+        serial_db = datawrapper.serial_db
+        try:
+            bits = ArbitraryBits(data)
+            if bits.eat(8) != 128:
+                return (-1, -1, -1, -1, -1, -1, 0)
+            version = bits.eat(7)
+            if version > serial_db.max_version:
+                return (version, -1, -1, -1, -1, -1, 0)
+            balance_idx = bits.eat(serial_db.get_num_bits('InventoryBalanceData', version))
+            invdata_idx = bits.eat(serial_db.get_num_bits('InventoryData', version))
+            manufacturer_idx = bits.eat(serial_db.get_num_bits('ManufacturerData', version))
+            level = bits.eat(7)
+        except Exception:
+            return (-1, -1, -1, -1, -1, -1, 0)
+        header = (version, balance_idx, invdata_idx, manufacturer_idx, level)
+
+        # Now the parts, if we can
+        balance = serial_db.get_part('InventoryBalanceData', balance_idx)
+        if not balance:
+            balance = 'unknown'
+        part_invkey = datawrapper.invkey_db.get(balance)
+        if part_invkey is None:
+            return header + (-1, 0)
+        try:
+            # Regular parts, which we just skip over
+            part_bits = serial_db.get_num_bits(part_invkey, version)
+            bits.eat(part_bits*bits.eat(6))
+
+            # Generics, where our Mayhem level lives
+            mayhem = 0
+            generic_bits = serial_db.get_num_bits('InventoryGenericPartData', version)
+            for _ in range(bits.eat(4)):
+                (part_name, part_idx) = serial_db.get_part_entry('InventoryGenericPartData', bits.eat(generic_bits))
+                if mayhem == 0 and part_name.lower() in mayhem_part_lower_to_lvl:
+                    mayhem = mayhem_part_lower_to_lvl[part_name.lower()]
+
+            # Additional data, customs, and rerolls, after which there should
+            # only be zero-padding left
+            bits.eat(8*bits.eat(8))
+            if bits.eat(4) != 0:
+                return header + (-1, 0)
+            if serial_version >= 4:
+                bits.eat(8)
+            if len(bits) > 7 or bits.value != 0:
+                return header + (-1, 0)
+        except Exception:
+            return header + (-1, 0)
+        return header + (mayhem, 1)
+
+    def __len__(self):
+        return len(self.data['index'])
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def _take(self, rows):
+        """
+        Returns a new table containing just the given `rows`, in order
+        """
+        if numpy is not None:
+            rows = numpy.asarray(rows, dtype=numpy.intp)
+            data = {name: column[rows] for (name, column) in self.data.items()}
+        else:
+            data = {name: array.array('i', [column[row] for row in rows]) for (name, column) in self.data.items()}
+        return ItemTable(None, self.datawrapper, _rows=(self.serials, self.decrypted, data))
+
+    def filter(self, mask):
+        """
+        Returns a new table with just the rows for which `mask` is true
+        """
+        if numpy is not None:
+            mask = numpy.asarray(mask, dtype=bool)
+            if len(mask) != len(self):
+                raise Exception('Mask has {} entries, but table has {} rows'.format(len(mask), len(self)))
+            return self._take(numpy.flatnonzero(mask))
+        mask = list(mask)
+        if len(mask) != len(self):
+            raise Exception('Mask has {} entries, but table has {} rows'.format(len(mask), len(self)))
+        return self._take([row for (row, keep) in enumerate(mask) if keep])
+
+    def sort(self, *names, reverse=False):
+        """
+        Returns a new table sorted by the given column `names` (the first
+        column being the primary sort key).  The sort is stable, so rows
+        which compare equal stay in the same order they were in.
+        """
+        if not names:
+            names = ('index',)
+        sign = -1 if reverse else 1
+        if numpy is not None:
+            # `lexsort` uses its *last* key as the primary one
+            keys = [self.data[name].astype(numpy.int64)*sign for name in reversed(names)]
+            return self._take(numpy.lexsort(keys))
+        columns = [self.data[name] for name in names]
+        return self._take(sorted(range(len(self)), key=lambda row: [sign*column[row] for column in columns]))
+
+    def group_by(self, name):
+        """
+        Returns a dict mapping each distinct value in the column `name` to a
+        table of the rows which have that value, in order of value.
+        """
+        column = self.data[name]
+        groups = {}
+        if numpy is not None:
+            for value in numpy.unique(column).tolist():
+                groups[value] = self._take(numpy.flatnonzero(column == value))
+        else:
+            rows = {}
+            for (row, value) in enumerate(column):
+                rows.setdefault(value, []).append(row)
+            for value in sorted(rows.keys()):
+                groups[value] = self._take(rows[value])
+        return groups
+
+    def get_names(self, name):
+        """
+        Returns a list of the names for the index column `name` (one of the
+        keys in `name_categories`), with `None` for any we don't know.
+        """
+        category = self.name_categories[name]
+        serial_db = self.datawrapper.serial_db
+        return [serial_db.get_part(category, idx) for idx in self.data[name].tolist()]
+
+    def get_item(self, row):
+        """
+        Returns a `BL3Serial` for the item at the given `row`
+        """
+        idx = int(self.data['index'][row])
+        return BL3Serial(self.serials[idx], self.datawrapper, self.decrypted[idx])
+
+# Cache for our decoded data resources.  Library users can set this to `None`
+# to always decode the packaged resources directly.
+resource_cache = ResourceCache()
+
+def load_resource(filename):
+    """
+    Loads and returns the data from one of our packaged `resources/*.json.xz`
+    files, going through `resource_cache` if we've got one.
+    """
+    raw_data = importlib.resources.files(__package__).joinpath(
+            'resources/{}'.format(filename)).read_bytes()
+    if resource_cache is None:
+        return _decode_resource(raw_data)
+    return resource_cache.load(filename, raw_data, _decode_resource)
+
+def _decode_resource(raw_data):
+    """
+    Decodes the raw contents of one of our `.json.xz` resource files
+    """
+    with lzma.open(io.BytesIO(raw_data)) as df:
+        return json.load(df)
+
+def _open_binary_serial_db():
+    """
+    Opens our packaged binary inventory serial DB (memory-mapping it, if it's
+    a regular file on disk).  Returns `None` if it's not available, or if it
+    wasn't generated from the same data as `inventoryserialdb.json.xz`, in
+    which case the JSON version should be used instead.
+    """
+    resources = importlib.resources.files(__package__).joinpath('resources')
+    try:
+        binary = resources.joinpath('inventoryserialdb.bin')
+        if isinstance(binary, pathlib.Path):
+            bindb = serialdb.SerialDB.open(binary)
+        else:
+            bindb = serialdb.SerialDB(binary.read_bytes())
+    except Exception:
+        return None
+    json_hash = hashlib.sha256(resources.joinpath('inventoryserialdb.json.xz').read_bytes()).digest()
+    if bindb.source_hash != json_hash:
+        return None
+    return bindb
+
 class InventorySerialDB(object):
     """
-    Little wrapper to provide access to our inventory serial number DB
+    Little wrapper to provide access to our inventory serial number DB.  By
+    default this reads from the memory-mapped binary version of the DB (see
+    `serialdb`), so only the bits we actually need get loaded; in that case
+    `self.bindb` will be set and `self.db` will be `None`.  Otherwise (or if
+    `use_binary` is `False`), the JSON version gets loaded into `self.db`.
     """
 
-    def __init__(self):
+    def __init__(self, use_binary=True):
         self.initialized = False
+        self._lock = threading.Lock()
+        self.use_binary = use_binary
         self.db = None
+        self.bindb = None
         self._max_version = -1
-        self.part_cache = {}
+        self.bits_tables = {}
+        self.part_names = {}
+        self.part_index = {}
+        self.part_index_lower = {}
+        self.entry_cache = {}
 
     def _initialize(self):
         """
         Actually read in our data.  Not doing this automatically because I
         only want to do it if we're doing an operation which requires it.
-        """
-        if not self.initialized:
-            with lzma.open(io.BytesIO(importlib.resources.files(__name__).joinpath(
-                    'resources/inventoryserialdb.json.xz').read_bytes()
-                    )) as df:
-                self.db = json.load(df)
-            self.initialized = True
+        The lock makes sure that only one thread does the loading, if we're
+        being shared.
+        """
+        with self._lock:
+            if self.initialized:
+                return
+            if self.use_binary:
+                self.bindb = _open_binary_serial_db()
+            if self.bindb is not None:
+                self._max_version = self.bindb.max_version
+            else:
+                self.db = load_resource('inventoryserialdb.json.xz')
 
-            # I generally shy away from complex one-liners like this, but eh?
-            self._max_version = max(
-                    [max([v['version'] for v in category['versions']]) for category in self.db.values()]
-                    )
+                # I generally shy away from complex one-liners like this, but eh?
+                self._max_version = max(
+                        [max([v['version'] for v in category['versions']]) for category in self.db.values()]
+                        )
+            self.initialized = True
 
     @property
     def max_version(self):
@@ -789,6 +1388,23 @@ class InventorySerialDB(object):
             self._initialize()
         return self._max_version
 
+    def _get_bits_table(self, category):
+        """
+        Returns the table of bit widths for `category`, indexed by serial
+        version (from `0` to `max_version`), building it the first time it's
+        asked for.  Every item needs several of these looked up, so it's
+        worth not having to work them out each time.
+        """
+        table = self.bits_tables.get(category)
+        if table is None:
+            if self.bindb is not None:
+                table = self.bindb.get_bits_table(category)
+            else:
+                table = [self._find_num_bits(category, version)
+                        for version in range(self._max_version+1)]
+            self.bits_tables[category] = table
+        return table
+
     def get_num_bits(self, category, version):
         """
         Returns the number of bits used for the specified `category`, using
@@ -796,6 +1412,25 @@ class InventorySerialDB(object):
         """
         if not self.initialized:
             self._initialize()
+        table = self._get_bits_table(category)
+        if 0 <= version < len(table):
+            return table[version]
+        return self._find_num_bits(category, version)
+
+    def _find_num_bits(self, category, version):
+        """
+        Works out the number of bits used for the specified `category`, using
+        a serial with version `version`, by looking through the category's
+        version list.  `get_num_bits` is the quicker way to get at this.
+        """
+        if self.bindb is not None:
+            # The binary DB only has the tables, but anything outside of them
+            # just gets the first or last width anyway.
+            table = self._get_bits_table(category)
+            if version < 0:
+                return table[0]
+            else:
+                return table[-1]
         cur_bits = self.db[category]['versions'][0]['bits']
         for cat_version in self.db[category]['versions']:
             if cat_version['version'] > version:
@@ -812,30 +1447,119 @@ class InventorySerialDB(object):
             self._initialize()
         if index < 1:
             return None
+        elif self.bindb is not None:
+            # Hang on to the names we've read, since items tend to use the
+            # same ones over and over.
+            category_names = self.part_names.get(category)
+            if category_names is None:
+                category_names = self.part_names[category] = {}
+            part = category_names.get(index)
+            if part is None:
+                if index > self.bindb.get_num_assets(category):
+                    return None
+                part = category_names[index] = self.bindb.get_asset(category, index-1)
+            return part
         else:
             if index > len(self.db[category]['assets']):
                 return None
             else:
                 return self.db[category]['assets'][index-1]
 
-    def get_part_index(self, category, part_name):
+    def get_part_entry(self, category, index):
+        """
+        Returns a tuple of the part name for `index` in the specified
+        `category` (or `unknown`, if we don't know of one), and the index
+        itself.  Items tend to share an awful lot of parts, so the same tuple
+        gets handed out each time.
+        """
+        category_cache = self.entry_cache.get(category)
+        if category_cache is None:
+            category_cache = self.entry_cache[category] = {}
+        entry = category_cache.get(index)
+        if entry is None:
+            part_val = self.get_part(category, index)
+            if not part_val:
+                part_val = 'unknown'
+            entry = category_cache[index] = (part_val, index)
+        return entry
+
+    def _get_part_index_dict(self, category, case_sensitive=True):
+        """
+        Returns a dict mapping every part name in the given `category` to its
+        index, building it the first time it's asked for.  If `case_sensitive`
+        is `False`, the dict's keys will be lowercased part names instead.
+        """
+        if case_sensitive:
+            indexes = self.part_index
+        else:
+            indexes = self.part_index_lower
+        category_index = indexes.get(category)
+        if category_index is None:
+            if not self.initialized:
+                self._initialize()
+            if self.bindb is not None:
+                assets = self.bindb.get_assets(category)
+            else:
+                assets = self.db[category]['assets']
+            category_index = {}
+            for idx, asset_part_name in enumerate(assets):
+                if not case_sensitive:
+                    asset_part_name = asset_part_name.lower()
+                # If a name shows up more than once, the first one wins
+                if asset_part_name not in category_index:
+                    category_index[asset_part_name] = idx+1
+            indexes[category] = category_index
+        return category_index
+
+    def get_part_index(self, category, part_name, case_sensitive=True):
         """
         Find the correct index to use for the given `part_name`, inside the given
-        `category`.  Will return `None` if the part cannot be found.
+        `category`.  Will return `None` if the part cannot be found.  If
+        `case_sensitive` is `False`, `part_name` will be matched regardless of
+        case.
         """
         if not self.initialized:
             self._initialize()
-        if category not in self.part_cache:
-            self.part_cache[category] = {}
-        if part_name not in self.part_cache[category]:
-            for idx, asset_part_name in enumerate(self.db[category]['assets']):
-                if part_name == asset_part_name:
-                    self.part_cache[category][part_name] = idx+1
-                    return idx+1
-        if part_name in self.part_cache[category]:
-            return self.part_cache[category][part_name]
-        else:
-            return None
+        if not case_sensitive:
+            part_name = part_name.lower()
+        elif self.bindb is not None:
+            # The binary DB has its own name index, so there's no need to
+            # build one.
+            idx = self.bindb.find_asset(category, part_name)
+            if idx is None:
+                return None
+            return idx+1
+        return self._get_part_index_dict(category, case_sensitive).get(part_name)
+
+    def get_index_stats(self):
+        """
+        Returns a dict with some debugging info about the lookup tables we've
+        built so far, including an approximate count of the bytes they're
+        using.  Part names in the case-sensitive indexes are shared with the
+        DB itself, so only the lowercased names are counted.
+        """
+        stats = {
+                'binary_db': self.bindb is not None,
+                'bits_tables': len(self.bits_tables),
+                'part_index_categories': len(self.part_index),
+                'part_index_entries': sum([len(d) for d in self.part_index.values()]),
+                'part_index_lower_categories': len(self.part_index_lower),
+                'part_index_lower_entries': sum([len(d) for d in self.part_index_lower.values()]),
+                'part_names_entries': sum([len(d) for d in self.part_names.values()]),
+                'entry_cache_entries': sum([len(d) for d in self.entry_cache.values()]),
+                }
+        num_bytes = sys.getsizeof(self.bits_tables)
+        for table in self.bits_tables.values():
+            num_bytes += sys.getsizeof(table)
+        for indexes in (self.part_index, self.part_index_lower):
+            num_bytes += sys.getsizeof(indexes)
+            for category_index in indexes.values():
+                num_bytes += sys.getsizeof(category_index)
+        for category_index in self.part_index_lower.values():
+            for part_name in category_index.keys():
+                num_bytes += sys.getsizeof(part_name)
+        stats['approx_bytes'] = num_bytes
+        return stats
 
 class BalanceToName(object):
     """
@@ -846,18 +1570,19 @@ class BalanceToName(object):
     def __init__(self):
         self.initialized = False
         self.mapping = None
+        self._lock = threading.Lock()
 
     def _initialize(self):
         """
         Actually read in our data.  Not doing this automatically because I
         only want to do it if we're doing an operation which requires it.
+        The lock makes sure that only one thread does the loading, if we're
+        being shared.
         """
-        if not self.initialized:
-            with lzma.open(io.BytesIO(importlib.resources.files(__name__).joinpath(
-                    'resources/balance_name_mapping.json.xz').read_bytes()
-                    )) as df:
-                self.mapping = json.load(df)
-            self.initialized = True
+        with self._lock:
+            if not self.initialized:
+                self.mapping = load_resource('balance_name_mapping.json.xz')
+                self.initialized = True
 
     def get(self, balance):
         """
@@ -882,18 +1607,19 @@ class BalanceToInvKey(object):
     def __init__(self):
         self.initialized = False
         self.mapping = None
+        self._lock = threading.Lock()
 
     def _initialize(self):
         """
         Actually read in our data.  Not doing this automatically because I
         only want to do it if we're doing an operation which requires it.
+        The lock makes sure that only one thread does the loading, if we're
+        being shared.
         """
-        if not self.initialized:
-            with lzma.open(io.BytesIO(importlib.resources.files(__name__).joinpath(
-                    'resources/balance_to_inv_key.json.xz').read_bytes()
-                    )) as df:
-                self.mapping = json.load(df)
-            self.initialized = True
+        with self._lock:
+            if not self.initialized:
+                self.mapping = load_resource('balance_to_inv_key.json.xz')
+                self.initialized = True
 
     def get(self, balance):
         """
@@ -923,3 +1649,22 @@ class DataWrapper(object):
         self.name_db = BalanceToName()
         self.invkey_db = BalanceToInvKey()
 
+# The DataWrapper that BL3Save and BL3Profile objects share, unless they're
+# given one of their own.  Use `get_default_datawrapper` to get at it.
+_default_datawrapper = None
+_default_datawrapper_lock = threading.Lock()
+
+def get_default_datawrapper():
+    """
+    Returns the process-wide default DataWrapper, creating it the first time
+    it's asked for.  Since its data only gets loaded once, tools which open
+    lots of files don't have to keep reloading it for every file.  It's fine
+    to share between threads.
+    """
+    global _default_datawrapper
+    if _default_datawrapper is None:
+        with _default_datawrapper_lock:
+            if _default_datawrapper is None:
+                _default_datawrapper = DataWrapper()
+    return _default_datawrapper
+
@@ -0,0 +1,654 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+# The payload encryption scheme handled in here was helpfully provided by
+# Gibbed (rick 'at' gibbed 'dot' us), so many thanks for that!
+# https://twitter.com/gibbed/status/1246863435868049410?s=19
+
+import os
+import mmap
+import uuid
+import struct
+import itertools
+import contextlib
+
+# NumPy is entirely optional; if it's around we'll use it, but the pure-Python
+# implementation is plenty fast for the savegames we're likely to see.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class PayloadCodec(object):
+    """
+    Handles the XOR-based obfuscation applied to the protobuf payload inside
+    BL3 savegames and profiles.  The two file types use the same scheme, just
+    with different magic values.
+
+    Each payload byte is XORed with a byte from `xor_magic` (cycling every 32
+    bytes) and with the *encrypted* byte 32 positions earlier (or a byte from
+    `prefix_magic`, for the first 32 bytes).  That means decryption only ever
+    looks at ciphertext, so it can be done all at once, and encryption is
+    just a running XOR down 32 independent "lanes."  Rather than processing a
+    byte at a time in a Python loop, we work on the whole buffer: via NumPy,
+    if it's available, or otherwise by treating the data as one giant Python
+    integer, which lets the XORs and shifts happen in C.
+    """
+
+    block_size = 32
+
+    # Size of the chunks we process at once.  This just keeps our temporary
+    # working data bounded; it must be a multiple of `block_size`.
+    chunk_size = 1024*1024
+
+    def __init__(self, prefix_magic, xor_magic):
+        if len(prefix_magic) != self.block_size or len(xor_magic) != self.block_size:
+            raise Exception('Payload magic values must be {} bytes long'.format(self.block_size))
+        self.prefix_magic = bytes(prefix_magic)
+        self.xor_magic = bytes(xor_magic)
+
+    def _key(self, length):
+        """
+        Returns `xor_magic` repeated out to `length` bytes
+        """
+        return (self.xor_magic * (length // self.block_size + 1))[:length]
+
+    def decrypt(self, data):
+        """
+        Decrypts the given `data`, returning a new bytearray
+        """
+        to_ret = bytearray(len(data))
+        self.decrypt_into(data, to_ret)
+        return to_ret
+
+    def decrypt_into(self, data, out):
+        """
+        Decrypts the given `data` (anything supporting the buffer protocol,
+        such as an `mmap`), writing the result into the preallocated writable
+        buffer `out`, which must be the same length.
+        """
+        if len(out) != len(data):
+            raise Exception('Output buffer is {} bytes, but data is {} bytes'.format(len(out), len(data)))
+        with memoryview(data) as cipher, memoryview(out) as plain:
+            for start in range(0, len(cipher), self.chunk_size):
+                end = min(start + self.chunk_size, len(cipher))
+                if start == 0:
+                    previous = self.prefix_magic
+                else:
+                    previous = cipher[start-self.block_size:start]
+                if numpy is not None:
+                    self._decrypt_numpy(cipher[start:end], previous, plain[start:end])
+                else:
+                    self._decrypt_int(cipher[start:end], previous, plain[start:end])
+
+    def decrypt_range(self, data, start, end):
+        """
+        Decrypts just bytes `start` through `end` of the encrypted `data`,
+        returning a new bytearray.  Our chunk routines expect to start on a
+        block boundary, so we back up to one and trim the result.
+        """
+        if end <= start:
+            return bytearray()
+        aligned = start - (start % self.block_size)
+        if aligned == 0:
+            previous = self.prefix_magic
+        else:
+            previous = data[aligned-self.block_size:aligned]
+        out = bytearray(end - aligned)
+        if numpy is not None:
+            self._decrypt_numpy(data[aligned:end], previous, out)
+        else:
+            self._decrypt_int(data[aligned:end], previous, out)
+        del out[:start-aligned]
+        return out
+
+    def encrypt(self, data):
+        """
+        Encrypts the given `data`, returning a new bytearray
+        """
+        to_ret = bytearray(len(data))
+        self.encrypt_into(data, to_ret)
+        return to_ret
+
+    def encrypt_into(self, data, out):
+        """
+        Encrypts the given `data`, writing the result into the preallocated
+        writable buffer `out`, which must be the same length.  Each chunk
+        only needs the last block of ciphertext from the chunk before it.
+        """
+        if len(out) != len(data):
+            raise Exception('Output buffer is {} bytes, but data is {} bytes'.format(len(out), len(data)))
+        with memoryview(data) as plain, memoryview(out) as cipher:
+            for start in range(0, len(plain), self.chunk_size):
+                end = min(start + self.chunk_size, len(plain))
+                if start == 0:
+                    previous = self.prefix_magic
+                else:
+                    previous = cipher[start-self.block_size:start]
+                if numpy is not None:
+                    self._encrypt_numpy(plain[start:end], previous, cipher[start:end])
+                else:
+                    self._encrypt_int(plain[start:end], previous, cipher[start:end])
+
+    def encrypt_chunks(self, data):
+        """
+        Generator which encrypts `data` a chunk at a time, yielding a new
+        bytearray of ciphertext for each chunk.  The only state carried from
+        one chunk to the next is the last block of ciphertext, so no matter
+        how large `data` is, we never hold more than one chunk of output.
+        """
+        previous = self.prefix_magic
+        with memoryview(data) as plain:
+            for start in range(0, len(plain), self.chunk_size):
+                end = min(start + self.chunk_size, len(plain))
+                cipher = bytearray(end - start)
+                if numpy is not None:
+                    self._encrypt_numpy(plain[start:end], previous, cipher)
+                else:
+                    self._encrypt_int(plain[start:end], previous, cipher)
+                previous = bytes(cipher[-self.block_size:])
+                yield cipher
+
+    def _decrypt_int(self, data, previous, out):
+        """
+        Pure-Python decryption of a single chunk, whose start is aligned on a
+        block boundary.  `previous` is the block of ciphertext immediately
+        preceding the chunk (or the prefix magic, for the first chunk).
+        Stored little-endian, byte `i` of the data lives at bit `8*i`, so
+        shifting left by a block lines each byte up with the one 32 bytes
+        before it.
+        """
+        length = len(data)
+        mask = (1 << (length*8)) - 1
+        cipher = int.from_bytes(data, 'little')
+        previous = ((cipher << (self.block_size*8)) | int.from_bytes(previous, 'little')) & mask
+        key = int.from_bytes(self._key(length), 'little')
+        out[:] = (cipher ^ previous ^ key).to_bytes(length, 'little')
+
+    def _encrypt_int(self, data, previous, out):
+        """
+        Pure-Python encryption of a single chunk; see `_decrypt_int` for the
+        arguments, though here `previous` is the block of ciphertext we've
+        just *written*.  After applying the key (and folding `previous` into
+        the first block), each block needs to be XORed with every block before
+        it.  That's a prefix scan, which we can do in log2(blocks) passes by
+        XORing the data with itself shifted by 1, 2, 4, ... blocks.
+        """
+        length = len(data)
+        mask = (1 << (length*8)) - 1
+        key = int.from_bytes(self._key(length), 'little')
+        value = (int.from_bytes(data, 'little') ^ key ^ int.from_bytes(previous, 'little')) & mask
+        shift = self.block_size*8
+        while shift < length*8:
+            value ^= (value << shift) & mask
+            shift <<= 1
+        out[:] = value.to_bytes(length, 'little')
+
+    def _decrypt_numpy(self, data, previous, out):
+        """
+        NumPy decryption of a single chunk; see `_decrypt_int` for the
+        arguments.
+        """
+        length = len(data)
+        cipher = numpy.frombuffer(data, dtype=numpy.uint8)
+        plain = numpy.frombuffer(out, dtype=numpy.uint8)
+        key = numpy.resize(numpy.frombuffer(self.xor_magic, dtype=numpy.uint8), length)
+        numpy.bitwise_xor(cipher, key, out=plain)
+        head = min(length, self.block_size)
+        plain[:head] ^= numpy.frombuffer(previous, dtype=numpy.uint8)[:head]
+        plain[self.block_size:] ^= cipher[:-self.block_size]
+
+    def _encrypt_numpy(self, data, previous, out):
+        """
+        NumPy encryption of a single chunk; see `_encrypt_int` for the
+        arguments.  We pad the data out to a whole number of blocks so that
+        it can be viewed as a 2D array with one column per lane, at which
+        point the running XOR is a single `accumulate` call.
+        """
+        length = len(data)
+        if length == 0:
+            return
+        rows = -(-length // self.block_size)
+        buf = numpy.zeros(rows*self.block_size, dtype=numpy.uint8)
+        buf[:length] = numpy.frombuffer(data, dtype=numpy.uint8)
+        buf ^= numpy.resize(numpy.frombuffer(self.xor_magic, dtype=numpy.uint8), len(buf))
+        buf[:self.block_size] ^= numpy.frombuffer(previous, dtype=numpy.uint8)
+        lanes = buf.reshape(rows, self.block_size)
+        numpy.bitwise_xor.accumulate(lanes, axis=0, out=lanes)
+        numpy.frombuffer(out, dtype=numpy.uint8)[:] = buf[:length]
+
+class PayloadView(object):
+    """
+    A read-only view of an encrypted payload which looks like the decrypted
+    data, but only decrypts the bytes which actually get asked for.  Indexing
+    returns an int and slicing returns a bytearray, which is all that
+    `protowire` needs, so it can walk a message while skipping right over
+    the (undecrypted) contents of fields it doesn't care about.
+
+    Single bytes are served out of a small decrypted page, since walking a
+    message reads a handful of bytes at a time from nearby spots.
+    """
+
+    page_size = 4096
+
+    def __init__(self, data, codec):
+        self.data = data
+        self.codec = codec
+        self._page_start = 0
+        self._page = bytearray()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            index = key - self._page_start
+            if 0 <= index < len(self._page):
+                return self._page[index]
+            return self._load_page(key)
+        (start, stop, step) = key.indices(len(self.data))
+        if step != 1:
+            raise Exception('PayloadView does not support extended slicing')
+        return self.codec.decrypt_range(self.data, start, stop)
+
+    def _load_page(self, key):
+        """
+        Decrypts the page containing index `key`, and returns that byte
+        """
+        if key < 0:
+            key += len(self.data)
+        if key < 0 or key >= len(self.data):
+            raise IndexError('PayloadView index out of range')
+        self._page_start = key - (key % self.page_size)
+        self._page = self.codec.decrypt_range(self.data,
+                self._page_start,
+                min(self._page_start + self.page_size, len(self.data)))
+        return self._page[key - self._page_start]
+
+class GVASHeader(object):
+    """
+    The GVAS header found at the start of both savegames and profiles.  This
+    was gleaned from 13xforever/Ilya's "gvas-converter" project:
+    https://github.com/13xforever/gvas-converter
+
+    The attribute names here match the ones that BL3Save and BL3Profile have
+    always used for the same data.
+    """
+
+    fields = [
+            'sg_version',
+            'pkg_version',
+            'engine_major',
+            'engine_minor',
+            'engine_patch',
+            'engine_build',
+            'build_id',
+            'fmt_version',
+            'custom_format_data',
+            'sg_type',
+            ]
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, None)
+        self.custom_format_data = []
+
+        # Where the (encrypted) payload lives, when we've been parsed
+        # out of an actual file.
+        self.payload_offset = None
+        self.payload_len = None
+
+    @staticmethod
+    def parse(data):
+        """
+        Parses a header from the start of `data` (anything supporting the
+        buffer protocol), returning a new GVASHeader object.  The payload
+        itself is not read, though `payload_offset` and `payload_len` will
+        point to it.
+        """
+        header = GVASHeader()
+        reader = _BufferReader(data)
+        assert(reader.read_bytes(4) == b'GVAS')
+        header.sg_version = reader.read_int()
+        header.pkg_version = reader.read_int()
+        header.engine_major = reader.read_short()
+        header.engine_minor = reader.read_short()
+        header.engine_patch = reader.read_short()
+        header.engine_build = reader.read_int()
+        header.build_id = reader.read_str()
+        header.fmt_version = reader.read_int()
+        fmt_count = reader.read_int()
+        for _ in range(fmt_count):
+            guid = reader.read_guid()
+            entry = reader.read_int()
+            header.custom_format_data.append((guid, entry))
+        header.sg_type = reader.read_str()
+        header.payload_len = reader.read_int()
+        header.payload_offset = reader.offset
+        return header
+
+    def __eq__(self, other):
+        if not isinstance(other, GVASHeader):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.fields + [
+            'payload_offset',
+            'payload_len',
+            ])
+
+    def print_debug(self, label):
+        """
+        Prints out our header information, using `label` to describe what
+        kind of file we came from.
+        """
+        print('{} version: {}'.format(label, self.sg_version))
+        print('Package version: {}'.format(self.pkg_version))
+        print('Engine version: {}.{}.{}.{}'.format(
+            self.engine_major,
+            self.engine_minor,
+            self.engine_patch,
+            self.engine_build,
+            ))
+        print('Build ID: {}'.format(self.build_id))
+        print('Custom Format Version: {}'.format(self.fmt_version))
+        print('Custom Format Data Count: {}'.format(len(self.custom_format_data)))
+        for guid, entry in self.custom_format_data:
+            print(' - GUID {}: {}'.format(guid, entry))
+        print('{} type: {}'.format(label, self.sg_type))
+
+    @staticmethod
+    def from_object(obj):
+        """
+        Returns a new GVASHeader object populated from the header attributes
+        on `obj` (a BL3Save or BL3Profile).  This is the inverse of `copy_to`.
+        """
+        header = GVASHeader()
+        for field in GVASHeader.fields:
+            setattr(header, field, getattr(obj, field))
+        return header
+
+    def to_bytes(self, payload_len):
+        """
+        Serializes this header, followed by the given payload length, returning
+        the bytes which should precede a payload of that length on disk.
+        """
+        parts = [
+                b'GVAS',
+                struct.pack('<IIHHHI',
+                    self.sg_version,
+                    self.pkg_version,
+                    self.engine_major,
+                    self.engine_minor,
+                    self.engine_patch,
+                    self.engine_build,
+                    ),
+                _pack_str(self.build_id),
+                struct.pack('<II', self.fmt_version, len(self.custom_format_data)),
+                ]
+        for guid, entry in self.custom_format_data:
+            parts.append(guid)
+            parts.append(struct.pack('<I', entry))
+        parts.append(_pack_str(self.sg_type))
+        parts.append(struct.pack('<I', payload_len))
+        return b''.join(parts)
+
+    def copy_to(self, obj):
+        """
+        Copies our header fields into attributes on `obj`
+        """
+        for field in self.fields:
+            setattr(obj, field, getattr(self, field))
+
+def _pack_str(value):
+    """
+    Serializes a GVAS string.  `None` and the empty string are stored
+    differently, which `_BufferReader.read_str` mirrors.
+    """
+    if value is None:
+        return struct.pack('<I', 0)
+    elif value == '':
+        return struct.pack('<I', 1)
+    else:
+        data = value.encode('utf-8') + b'\0'
+        return struct.pack('<I', len(data)) + data
+
+class _BufferReader(object):
+    """
+    Tiny cursor over a buffer, reading the little-endian GVAS datatypes
+    straight out of it with `struct.unpack_from`, so that we don't have to
+    copy anything out of an `mmap`ed file.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def _unpack(self, fmt):
+        value = struct.unpack_from(fmt, self.data, self.offset)[0]
+        self.offset += struct.calcsize(fmt)
+        return value
+
+    def read_int(self):
+        return self._unpack('<I')
+
+    def read_short(self):
+        return self._unpack('<H')
+
+    def read_bytes(self, length):
+        if self.offset + length > len(self.data):
+            raise Exception('Attempted to read {} bytes at offset {}, but data is only {} bytes'.format(
+                length, self.offset, len(self.data)))
+        value = bytes(self.data[self.offset:self.offset+length])
+        self.offset += length
+        return value
+
+    def read_str(self):
+        datalen = self.read_int()
+        if datalen == 0:
+            return None
+        elif datalen == 1:
+            return ''
+        else:
+            return self.read_bytes(datalen)[:-1].decode('utf-8')
+
+    def read_guid(self):
+        # A bit silly to bother formatting it, since we don't care.
+        return self.read_bytes(16)
+
+@contextlib.contextmanager
+def _map_file(filename):
+    """
+    Context manager which `mmap`s `filename` for reading, yielding the map.
+    Empty files (and some special files) can't be mapped, so for those we
+    just yield the file contents instead.
+    """
+    with open(filename, 'rb') as df:
+        try:
+            mapped = mmap.mmap(df.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            mapped = df.read()
+        try:
+            yield mapped
+        finally:
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+
+def _parse_file_header(mapped):
+    """
+    Parses the header out of the full file contents `mapped`, and makes sure
+    that the payload it describes is all that's left in the file.
+    """
+    header = GVASHeader.parse(mapped)
+    assert(header.payload_offset + header.payload_len == len(mapped))
+    return header
+
+def read_header(filename):
+    """
+    Reads just the GVAS header from `filename`, returning a GVASHeader
+    object.  The payload is left untouched (and undecrypted).
+    """
+    with _map_file(filename) as mapped:
+        return _parse_file_header(mapped)
+
+@contextlib.contextmanager
+def open_payload(filename, codec):
+    """
+    Context manager which yields a tuple containing the GVASHeader object for
+    `filename`, and a PayloadView for its payload, decrypted on demand with
+    `codec`.  The view is only valid inside the `with` block.
+    """
+    with _map_file(filename) as mapped:
+        header = _parse_file_header(mapped)
+        with memoryview(mapped) as view:
+            payload = view[header.payload_offset:header.payload_offset+header.payload_len]
+            try:
+                yield (header, PayloadView(payload, codec))
+            finally:
+                payload.release()
+
+def read_prefix(filename, codecs, length):
+    """
+    Reads the GVAS header from `filename`, along with (at most) the first
+    `length` bytes of its payload, decrypted with each codec in the list
+    `codecs`.  Returns a tuple containing the GVASHeader object and a list of
+    bytearrays, one per codec.  Since decryption only ever looks at the
+    ciphertext, a prefix can be decrypted without touching the rest.
+    """
+    with _map_file(filename) as mapped:
+        header = _parse_file_header(mapped)
+        start = header.payload_offset
+        data = mapped[start:start+min(length, header.payload_len)]
+    return (header, [codec.decrypt(data) for codec in codecs])
+
+def read_file(filename, codec, cache=None):
+    """
+    Reads the GVAS file at `filename`, returning a tuple containing the
+    GVASHeader object and a bytearray containing the payload, decrypted using
+    `codec`.  The file is `mmap`ed, so the only copy of the payload we end
+    up with is the decrypted one, which can be handed right to protobuf.
+
+    If `cache` is a `cache.PayloadCache` object, the decrypted payload will
+    be pulled from there if possible, and stored there otherwise.
+    """
+    with _map_file(filename) as mapped:
+        header = _parse_file_header(mapped)
+        if cache is not None:
+            key = cache.make_key(filename, mapped[:header.payload_offset])
+            data = cache.get(key, header.payload_len)
+            if data is not None:
+                return (header, data)
+        data = bytearray(header.payload_len)
+        with memoryview(mapped) as view:
+            codec.decrypt_into(view[header.payload_offset:header.payload_offset+header.payload_len], data)
+    if cache is not None:
+        cache.put(key, data)
+    return (header, data)
+
+def write_atomic(filename, chunks, length):
+    """
+    Writes the data from the iterable `chunks` (which should add up to
+    `length` bytes in total) to `filename`.  The data goes into a temporary
+    file in the same directory, which is then `fsync`ed and renamed over the
+    top of the destination, so a crash partway through will leave either the
+    old file or the new one, never a truncated one.
+
+    If the destination is already the right size, each chunk is compared
+    against it as we go, and nothing gets written until the first one which
+    differs (at which point the identical leading data is copied over from
+    the original).  So if the file already contains exactly our data, it's
+    left alone entirely.  Returns `True` if the file was written, or `False`
+    if it was left alone.
+    """
+
+    # Write through symlinks, rather than replacing them with a regular file
+    filename = os.path.realpath(filename)
+
+    # If we're replacing an existing file, keep its permissions.  Otherwise
+    # the usual umask-based default applies, same as a plain `open()`.
+    try:
+        stat = os.stat(filename)
+        mode = stat.st_mode & 0o7777
+        existing_len = stat.st_size
+    except OSError:
+        mode = None
+        existing_len = None
+
+    temp_filename = None
+    try:
+        # The temp file gets closed before the original is unmapped, and both
+        # happen before the rename (Windows won't replace a mapped file).
+        with contextlib.ExitStack() as stack:
+            existing = None
+            if existing_len == length:
+                existing = stack.enter_context(_map_file(filename))
+            df = None
+            offset = 0
+            for chunk in chunks:
+                if df is None:
+                    if existing is not None and existing[offset:offset+len(chunk)] == chunk:
+                        offset += len(chunk)
+                        continue
+                    temp_filename = _temp_filename(filename)
+                    fd = os.open(temp_filename,
+                            os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                            0o666)
+                    df = stack.enter_context(os.fdopen(fd, 'wb'))
+                    for start in range(0, offset, PayloadCodec.chunk_size):
+                        df.write(existing[start:min(start + PayloadCodec.chunk_size, offset)])
+                df.write(chunk)
+            if df is None:
+                return False
+            df.flush()
+            os.fsync(df.fileno())
+        if mode is not None:
+            os.chmod(temp_filename, mode)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if temp_filename is not None:
+            try:
+                os.unlink(temp_filename)
+            except OSError:
+                pass
+        raise
+    return True
+
+def _temp_filename(filename):
+    """
+    Returns a hidden, unique temporary filename alongside `filename`
+    """
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, '.{}.{}.tmp'.format(basename, uuid.uuid4().hex))
+
+def write_file(filename, header, payload, codec):
+    """
+    Writes a GVAS file to `filename`, using the GVASHeader object `header`,
+    followed by `payload` (the serialized protobuf) encrypted with `codec`.
+    The payload is encrypted and written out a chunk at a time, so aside from
+    `payload` itself, memory use stays bounded regardless of file size.
+    Returns `True` if the file was written, or `False` if its contents were
+    already identical.
+    """
+    header_data = header.to_bytes(len(payload))
+    return write_atomic(filename,
+            itertools.chain([header_data], codec.encrypt_chunks(payload)),
+            len(header_data) + len(payload),
+            )
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+# A tiny reader for the protobuf wire format, for when we only want to peek
+# at a few fields without paying for a full `ParseFromString`.  See:
+# https://protobuf.dev/programming-guides/encoding/
+
+from google.protobuf.descriptor import FieldDescriptor
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH = 2
+WIRE_START_GROUP = 3
+WIRE_END_GROUP = 4
+WIRE_FIXED32 = 5
+
+class WireError(Exception):
+    """
+    Raised when data doesn't look like a valid protobuf message
+    """
+
+class TruncatedError(WireError):
+    """
+    Raised when data ends partway through a field
+    """
+
+def read_varint(data, offset, end=None):
+    """
+    Reads a varint from `data` at `offset`, returning a tuple of the value
+    and the offset just past it.
+    """
+    if end is None:
+        end = len(data)
+    value = 0
+    shift = 0
+    while True:
+        if offset >= end:
+            raise TruncatedError('Data ended partway through a varint')
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (value, offset)
+        shift += 7
+        if shift >= 70:
+            raise WireError('Varint at offset {} is too long'.format(offset))
+
+def iter_fields(data, offset=0, end=None, field_numbers=None):
+    """
+    Generator which walks through the fields of the protobuf message stored
+    in `data` (between `offset` and `end`), yielding a tuple of field number,
+    wire type, and value for each.  Varints and fixed-width values are
+    yielded as (unsigned) ints, and length-delimited values as a slice of
+    `data`, so passing in a `memoryview` avoids copying anything.  Nested
+    messages aren't descended into; pass their slice back in for that.
+
+    If `field_numbers` is given, length-delimited values for any other
+    fields are skipped over without being read at all, and yielded as `None`.
+    """
+    if end is None:
+        end = len(data)
+    while offset < end:
+        # Most tags and lengths are a single byte, so skip the function call
+        # for those.
+        tag = data[offset]
+        if tag < 0x80:
+            offset += 1
+        else:
+            (tag, offset) = read_varint(data, offset, end)
+        field_number = tag >> 3
+        wire_type = tag & 0x7
+        if field_number == 0:
+            raise WireError('Invalid field number 0 at offset {}'.format(offset))
+        if wire_type == WIRE_VARINT:
+            (value, offset) = read_varint(data, offset, end)
+        elif wire_type == WIRE_FIXED64 or wire_type == WIRE_FIXED32:
+            width = 8 if wire_type == WIRE_FIXED64 else 4
+            if offset + width > end:
+                raise TruncatedError('Data ended partway through a fixed-width field')
+            value = int.from_bytes(data[offset:offset+width], 'little')
+            offset += width
+        elif wire_type == WIRE_LENGTH:
+            if offset < end and data[offset] < 0x80:
+                length = data[offset]
+                offset += 1
+            else:
+                (length, offset) = read_varint(data, offset, end)
+            if offset + length > end:
+                raise TruncatedError('Data ended partway through a length-delimited field')
+            if field_numbers is None or field_number in field_numbers:
+                value = data[offset:offset+length]
+            else:
+                value = None
+            offset += length
+        else:
+            raise WireError('Unsupported wire type {} at offset {}'.format(wire_type, offset))
+        yield (field_number, wire_type, value)
+
+def extract_fields(data, field_numbers, offset=0, end=None):
+    """
+    Walks the message in `data` (see `iter_fields`), returning a dict mapping
+    each of the given `field_numbers` which is present to its value.  As with
+    a real parse, if a field shows up more than once, the last one wins.
+    Fields which aren't present (as proto3 does for default values) will be
+    missing from the dict.
+    """
+    wanted = set(field_numbers)
+    to_ret = {}
+    for field_number, _, value in iter_fields(data, offset, end, wanted):
+        if field_number in wanted:
+            to_ret[field_number] = value
+    return to_ret
+
+def to_signed(value, bits=64):
+    """
+    Converts an unsigned varint to the signed value it represents.  Negative
+    `int32`s are sign-extended out to 64 bits on the wire, so the default
+    works for those too.
+    """
+    if value >= (1 << (bits-1)):
+        value -= (1 << bits)
+    return value
+
+_type_to_wire = {
+        FieldDescriptor.TYPE_DOUBLE: WIRE_FIXED64,
+        FieldDescriptor.TYPE_FIXED64: WIRE_FIXED64,
+        FieldDescriptor.TYPE_SFIXED64: WIRE_FIXED64,
+        FieldDescriptor.TYPE_FLOAT: WIRE_FIXED32,
+        FieldDescriptor.TYPE_FIXED32: WIRE_FIXED32,
+        FieldDescriptor.TYPE_SFIXED32: WIRE_FIXED32,
+        FieldDescriptor.TYPE_STRING: WIRE_LENGTH,
+        FieldDescriptor.TYPE_BYTES: WIRE_LENGTH,
+        FieldDescriptor.TYPE_MESSAGE: WIRE_LENGTH,
+        FieldDescriptor.TYPE_GROUP: WIRE_START_GROUP,
+        }
+
+_wire_types_cache = {}
+
+def wire_types(descriptor):
+    """
+    Returns a dict mapping each field number in the message `descriptor` to
+    the set of wire types that field could show up as.  Repeated scalars can
+    be packed, so those get `WIRE_LENGTH` as an option as well.
+    """
+    if descriptor.full_name in _wire_types_cache:
+        return _wire_types_cache[descriptor.full_name]
+    to_ret = {}
+    for field in descriptor.fields:
+        wire_type = _type_to_wire.get(field.type, WIRE_VARINT)
+        to_ret[field.number] = {wire_type}
+        if field.label == FieldDescriptor.LABEL_REPEATED and wire_type != WIRE_LENGTH:
+            to_ret[field.number].add(WIRE_LENGTH)
+    _wire_types_cache[descriptor.full_name] = to_ret
+    return to_ret
+
+def count_matching_fields(data, descriptor):
+    """
+    Checks how well the start of `data` matches the message `descriptor`.
+    `data` may be cut off at any point; fields are checked until we run out.
+    Returns the number of complete fields whose field number and wire type
+    match the descriptor, or `None` if we hit anything which doesn't.
+    """
+    expected = wire_types(descriptor)
+    count = 0
+    try:
+        for field_number, wire_type, _ in iter_fields(data, field_numbers=()):
+            if wire_type not in expected.get(field_number, ()):
+                return None
+            count += 1
+    except TruncatedError:
+        pass
+    except WireError:
+        return None
+    return count
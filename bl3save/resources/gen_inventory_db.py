@@ -22,27 +22,40 @@
 # 3. This notice may not be removed or altered from any source distribution.
 
 import io
+import os
+import sys
 import lzma
 import json
 import codecs
+import hashlib
 import argparse
-from Crypto.Cipher import AES
+from bl3save import serialdb
 
 # Takes InventorySerialNumberDatabase.dat from inside the BL3 paks and turns
-# it into a compressed JSON file suitable for use in our savegame apps.
+# it into a compressed JSON file suitable for use in our savegame apps, plus
+# a binary version of the same data which the apps can memory-map (see
+# `bl3save/serialdb.py` for the details on that).
 # At user request, will also write out a version suitable for sending PRs
 # to https://github.com/gibbed/Borderlands3Dumps
-
-# Input/Output parameters
-input_file = 'InventorySerialNumberDatabase.dat'
-output_file = 'inventoryserialdb.json.xz'
-gibbed_file = 'Inventory Serial Number Database.json'
+#
+# Since this uses the binary DB writer from the main package, run it as a
+# module from the top level of the project:
+#
+#     python -m bl3save.resources.gen_inventory_db
+
+# Input/Output parameters.  These all live alongside this script.
+resource_dir = os.path.dirname(os.path.abspath(__file__))
+input_file = os.path.join(resource_dir, 'InventorySerialNumberDatabase.dat')
+output_file = os.path.join(resource_dir, 'inventoryserialdb.json.xz')
+binary_file = os.path.join(resource_dir, 'inventoryserialdb.bin')
+gibbed_file = os.path.join(resource_dir, 'Inventory Serial Number Database.json')
 
 ###
 ### Decryption bit.  Thanks to Baysix for this!
 ###
 
 def decrypt(key, data):
+    from Crypto.Cipher import AES
     cipher = AES.new(key, AES.MODE_ECB)
     return cipher.decrypt(data)
 
@@ -62,8 +75,29 @@ parser.add_argument('-g', '--gibbed',
         action='store_true',
         help='Also generate JSON suitable for sending PRs to Gibbed at https://github.com/gibbed/Borderlands3Dumps')
 
+parser.add_argument('-j', '--from-json',
+        action='store_true',
+        help="Don't process {}; just regenerate {} from the existing {}".format(
+            os.path.basename(input_file), os.path.basename(binary_file), os.path.basename(output_file)))
+
 args = parser.parse_args()
 
+def write_binary(top):
+    """
+    Writes out the binary version of the DB `top`, tagged with the hash of
+    the JSON version we just wrote (or already had).
+    """
+    with open(output_file, 'rb') as df:
+        source_hash = hashlib.sha256(df.read()).digest()
+    with open(binary_file, 'wb') as odf:
+        serialdb.write(top, odf, source_hash)
+    print('Wrote binary DB to {}'.format(binary_file))
+
+if args.from_json:
+    with lzma.open(output_file, 'rt') as df:
+        write_binary(json.load(df))
+    sys.exit(0)
+
 ###
 ### Do the work
 ###
@@ -111,6 +145,7 @@ with lzma.open(output_file, 'wt') as odf:
     json.dump(top, odf, separators=(',', ':'))
 print('')
 print('Wrote JSON to {}'.format(output_file))
+write_binary(top)
 
 # If we've been asked to, also generate a Gibbed-compatible JSON file, so that
 # diffs in that repo are nice and clean.  This is pretty stupidly done, but
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+# 
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+# 
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+# 
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+# 
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+# 
+# 3. This notice may not be removed or altered from any source distribution.
+
+
+# A compact binary version of `resources/inventoryserialdb.json.xz`, which
+# can be memory-mapped and read from directly.  The JSON version has to be
+# decompressed and turned into a big pile of dicts, lists, and strings
+# before we can look up a single part, which is a lot of work (and memory)
+# for a process that's only going to decode a handful of items.  Here,
+# nothing gets read until somebody asks for it.
+#
+# The file is generated by `resources/gen_inventory_db.py` alongside the
+# JSON.  All integers are little-endian unsigned 32-bit values, and all
+# offsets are from the start of the file.  The layout is:
+#
+#   Header:
+#     - Magic bytes (`BL3ISDB` plus a null)
+#     - Format version
+#     - Number of categories
+#     - Max serial version we know about
+#     - Offset of the category directory
+#     - SHA-256 hash of the `.json.xz` which this was generated alongside
+#
+#   Category directory, sorted by category name, one entry per category:
+#     - Offset and length of the category name
+#     - Offset of the bit-width table: one byte per serial version from `0`
+#       to the max version, giving the number of bits used for this category
+#     - Number of assets (parts) in the category
+#     - Offset of the asset offset array: one offset per asset pointing at
+#       the start of its name, plus a final one pointing just past the end
+#       of the last name
+#     - Offset and size (always a power of two) of the name hash table.
+#       Each slot contains an asset index plus one (zero means an empty
+#       slot), hashed with CRC32 and using linear probing.  If a name shows
+#       up more than once, only the first one is in the table.
+#
+#   Followed by all the data those point to.  Names are UTF-8.
+
+import mmap
+import zlib
+import struct
+
+magic = b'BL3ISDB\x00'
+format_version = 1
+
+header_struct = struct.Struct('<8sIIII32s')
+entry_struct = struct.Struct('<7I')
+uint_struct = struct.Struct('<I')
+uint_pair_struct = struct.Struct('<II')
+
+def write(db, df, source_hash):
+    """
+    Writes the inventory serial DB `db` (in the same format as the JSON
+    version) out to the binary file object `df`.  `source_hash` should be
+    the SHA-256 hash (as bytes) of the `.json.xz` file containing the same
+    data.
+    """
+    categories = sorted(db.keys())
+    max_version = max([max([v['version'] for v in db[c]['versions']]) for c in categories])
+
+    data = bytearray(header_struct.size + entry_struct.size*len(categories))
+    header_struct.pack_into(data, 0,
+            magic,
+            format_version,
+            len(categories),
+            max_version,
+            header_struct.size,
+            source_hash,
+            )
+
+    def align():
+        data.extend(b'\x00' * (-len(data) % 4))
+
+    for (cat_idx, category) in enumerate(categories):
+        name_offset = len(data)
+        name_bytes = category.encode('utf-8')
+        data.extend(name_bytes)
+
+        # Bit widths for every version
+        bits_offset = len(data)
+        for version in range(max_version+1):
+            cur_bits = db[category]['versions'][0]['bits']
+            for cat_version in db[category]['versions']:
+                if cat_version['version'] > version:
+                    break
+                cur_bits = cat_version['bits']
+            data.append(cur_bits)
+        align()
+
+        # Asset names, and the offsets pointing at them
+        assets = [asset.encode('utf-8') for asset in db[category]['assets']]
+        offsets_offset = len(data)
+        data.extend(b'\x00' * (4*(len(assets)+1)))
+        align()
+
+        # Name hash table
+        hash_size = 1
+        while hash_size < len(assets)*2:
+            hash_size *= 2
+        hash_offset = len(data)
+        slots = [0]*hash_size
+        seen = set()
+        for (idx, asset) in enumerate(assets):
+            if asset in seen:
+                continue
+            seen.add(asset)
+            slot = zlib.crc32(asset) & (hash_size-1)
+            while slots[slot] != 0:
+                slot = (slot+1) & (hash_size-1)
+            slots[slot] = idx+1
+        data.extend(struct.pack('<{}I'.format(hash_size), *slots))
+
+        # Now the names themselves
+        offsets = []
+        for asset in assets:
+            offsets.append(len(data))
+            data.extend(asset)
+        offsets.append(len(data))
+        struct.pack_into('<{}I'.format(len(offsets)), data, offsets_offset, *offsets)
+        align()
+
+        entry_struct.pack_into(data, header_struct.size + entry_struct.size*cat_idx,
+                name_offset,
+                len(name_bytes),
+                bits_offset,
+                len(assets),
+                offsets_offset,
+                hash_offset,
+                hash_size,
+                )
+
+    df.write(data)
+
+class SerialDB(object):
+    """
+    Read access to a binary inventory serial DB, generally memory-mapped
+    from disk (though any bytes-like object will do).  Only the category
+    directory is read when we're created; everything else is read only when
+    it's asked for.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        (file_magic,
+                file_version,
+                num_categories,
+                self.max_version,
+                directory_offset,
+                self.source_hash) = header_struct.unpack_from(data, 0)
+        if file_magic != magic:
+            raise Exception('Not a binary inventory serial DB')
+        if file_version != format_version:
+            raise Exception('Unknown binary inventory serial DB version: {}'.format(file_version))
+        self.categories = {}
+        for cat_idx in range(num_categories):
+            entry = entry_struct.unpack_from(data, directory_offset + entry_struct.size*cat_idx)
+            name = bytes(data[entry[0]:entry[0]+entry[1]]).decode('utf-8')
+            self.categories[name] = entry[2:]
+
+    @staticmethod
+    def open(filename):
+        """
+        Opens the binary DB at `filename` by memory-mapping it
+        """
+        with open(filename, 'rb') as df:
+            return SerialDB(mmap.mmap(df.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def get_bits_table(self, category):
+        """
+        Returns the bit-width table for `category`, as a bytes object indexed
+        by serial version
+        """
+        bits_offset = self.categories[category][0]
+        return bytes(self.data[bits_offset:bits_offset+self.max_version+1])
+
+    def get_num_assets(self, category):
+        """
+        Returns the number of assets in `category`
+        """
+        return self.categories[category][1]
+
+    def get_asset(self, category, index):
+        """
+        Returns the name of the asset at (zero-based) `index` in `category`
+        """
+        (start, end) = uint_pair_struct.unpack_from(self.data, self.categories[category][2] + 4*index)
+        return self.data[start:end].decode('utf-8')
+
+    def get_assets(self, category):
+        """
+        Returns a list of all the asset names in `category`
+        """
+        (_, num_assets, offsets_offset, _, _) = self.categories[category]
+        offsets = struct.unpack_from('<{}I'.format(num_assets+1), self.data, offsets_offset)
+        data = self.data
+        return [data[offsets[idx]:offsets[idx+1]].decode('utf-8') for idx in range(num_assets)]
+
+    def find_asset(self, category, name):
+        """
+        Returns the (zero-based) index of the asset `name` in `category`, or
+        `None` if it's not there.
+        """
+        (_, _, offsets_offset, hash_offset, hash_size) = self.categories[category]
+        name_bytes = name.encode('utf-8')
+        mask = hash_size-1
+        slot = zlib.crc32(name_bytes) & mask
+        data = self.data
+        while True:
+            idx = uint_struct.unpack_from(data, hash_offset + 4*slot)[0]
+            if idx == 0:
+                return None
+            (start, end) = uint_pair_struct.unpack_from(data, offsets_offset + 4*(idx-1))
+            if data[start:end] == name_bytes:
+                return idx-1
+            slot = (slot+1) & mask
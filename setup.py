@@ -33,6 +33,7 @@ setup(
         package_data={
             'bl3save': [
                 'resources/inventoryserialdb.json.xz',
+                'resources/inventoryserialdb.bin',
                 'resources/balance_name_mapping.json.xz',
                 'resources/balance_to_inv_key.json.xz',
                 ],
@@ -61,9 +62,11 @@ setup(
                 # Savegame-related scripts
                 'bl3-save-edit = bl3save.cli_edit:main',
                 'bl3-save-info = bl3save.cli_info:main',
+                'bl3-save-ls = bl3save.cli_ls:main',
                 'bl3-save-import-protobuf = bl3save.cli_import_protobuf:main',
                 'bl3-save-import-json = bl3save.cli_import_json:main',
                 'bl3-process-archive-saves = bl3save.cli_archive:main',
+                'bl3-decode-items = bl3save.cli_decode_items:main',
                 # Actually, gonna omit this one.  Without transferring a lot of other data,
                 # this can make things a bit weird, and at that point you may as well just
                 # copy the savegame and alter other bits about it.
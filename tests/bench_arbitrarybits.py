@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Microbenchmark for item serial parsing and re-encoding, using the serials
+# from `test_arbitrarybits`.  Also times the raw bit operations against the
+# original string-based implementation.  Run from the top level of the
+# project with:
+#
+#     python -m tests.bench_arbitrarybits
+
+import time
+import argparse
+from bl3save import datalib
+from tests.test_arbitrarybits import SERIALS, StringBits
+
+def report(label, count, elapsed):
+    """
+    Prints out how long `count` operations took
+    """
+    print('{:<36} {:>10.0f}/s  ({:.1f}us each)'.format(
+        label,
+        count/elapsed,
+        elapsed/count*1000000,
+        ))
+
+def bench_bits(bits_class, datas, iterations):
+    """
+    Times reading every serial's data off in 8-bit chunks, and then writing
+    it all back out again, using `bits_class`.  Returns the elapsed time.
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for data in datas:
+            bits = bits_class(data)
+            values = [bits.eat(8) for _ in range(len(data))]
+            out = bits_class()
+            for value in values:
+                out.append_value(value, 8)
+            out.get_data()
+    return time.perf_counter() - start
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark item serial parsing and re-encoding',
+            )
+
+    parser.add_argument('-n', '--iterations',
+            type=int,
+            default=200,
+            help='Number of times to run through the list of serials',
+            )
+
+    args = parser.parse_args()
+
+    datawrapper = datalib.get_default_datawrapper()
+    serials = [datalib.BL3Serial.decode_serial_base64(code) for code in SERIALS]
+    decrypted = [datalib.BL3Serial._decrypt_serial(serial) for serial in serials]
+    count = len(serials)*args.iterations
+
+    # Make sure the databases are loaded before we start timing anything
+    for (serial, dec) in zip(serials, decrypted):
+        datalib.BL3Serial(serial, datawrapper, dec)._parse_serial()
+
+    # Parsing, starting from already-decrypted data
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for (serial, dec) in zip(serials, decrypted):
+            datalib.BL3Serial(serial, datawrapper, dec)._parse_serial()
+    report('_parse_serial', count, time.perf_counter() - start)
+
+    # Re-encoding, without any changes to parts
+    items = [datalib.BL3Serial(serial, datawrapper, dec) for (serial, dec) in zip(serials, decrypted)]
+    for item in items:
+        item._parse_serial()
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for item in items:
+            item._deparse_serial()
+    report('_deparse_serial', count, time.perf_counter() - start)
+
+    # Re-encoding with changed parts, which rebuilds the whole serial
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for item in items:
+            item.changed_parts = item.parts_parsed
+            item._deparse_serial()
+    report('_deparse_serial (changed parts)', count, time.perf_counter() - start)
+
+    # And the raw bit operations, compared to the old string-based version
+    datas = [bytes(dec[0]) for dec in decrypted]
+    report('ArbitraryBits eat/append_value', count, bench_bits(datalib.ArbitraryBits, datas, args.iterations))
+    report('StringBits eat/append_value', count, bench_bits(StringBits, datas, args.iterations))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Benchmark for opening a whole directory of savegames, the way
+# `bl3-archive` does, and reading the name and level of every item in each.
+# Compares using the shared default DataWrapper with giving each file its
+# own (which is what BL3Save used to do), and makes sure both come up with
+# the same results.  Takes any savegame to use as a template, optionally
+# filling its backpack with the items from `test_arbitrarybits`.  Run from
+# the top level of the project with:
+#
+#     python -m tests.bench_archive_load template.sav
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from bl3save import datalib
+from bl3save.bl3save import BL3Save
+from tests.bench_backpack_load import make_backpack_save
+
+def load_all(filenames, per_file_datawrapper):
+    """
+    Opens all of `filenames` and reads the name and level of all their
+    items, returning what we found
+    """
+    results = []
+    for filename in filenames:
+        if per_file_datawrapper:
+            save = BL3Save(filename, datawrapper=datalib.DataWrapper())
+        else:
+            save = BL3Save(filename)
+        results.append([(item.eng_name, item.level) for item in save.get_items()])
+    return results
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark loading a directory full of savegames',
+            )
+
+    parser.add_argument('-f', '--files',
+            type=int,
+            default=500,
+            help='Number of savegames to load',
+            )
+
+    parser.add_argument('-i', '--items',
+            type=int,
+            help="Replace each savegame's inventory with this many items",
+            )
+
+    parser.add_argument('template',
+            help='Savegame to use as a template',
+            )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        source = os.path.join(tempdir, 'template.sav')
+        if args.items is None:
+            shutil.copyfile(args.template, source)
+        else:
+            make_backpack_save(args.template, source, args.items)
+        filenames = []
+        for idx in range(args.files):
+            filename = os.path.join(tempdir, '{}.sav'.format(idx))
+            shutil.copyfile(source, filename)
+            filenames.append(filename)
+
+        # Each run gets its own process-wide default, too, so the shared
+        # run pays for loading the data once, just like a real one would.
+        results = {}
+        print('{} files:'.format(args.files))
+        for (label, per_file) in [('shared DataWrapper', False), ('per-file DataWrapper', True)]:
+            datalib._default_datawrapper = None
+            start = time.perf_counter()
+            results[label] = load_all(filenames, per_file)
+            elapsed = time.perf_counter() - start
+            print('  {:<22} {:8.2f}s total, {:8.2f}ms per file'.format(
+                label, elapsed, elapsed*1000/args.files))
+
+        if results['shared DataWrapper'] != results['per-file DataWrapper']:
+            raise SystemExit('ERROR: results do not match')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Benchmark for loading savegames with big backpacks, comparing the lazy
+# `BL3ItemList` against wrapping every item up front (which is what
+# `import_protobuf` used to do).  Takes any savegame to use as a template,
+# and fills its backpack up with copies of the items from
+# `test_arbitrarybits`.  Run from the top level of the project with:
+#
+#     python -m tests.bench_backpack_load template.sav
+
+import os
+import gc
+import time
+import argparse
+import itertools
+import tempfile
+from bl3save import datalib
+from bl3save.bl3save import BL3Save, BL3Item
+from tests.test_arbitrarybits import SERIALS
+
+def make_backpack_save(template, filename, num_items):
+    """
+    Writes a copy of the savegame `template` to `filename`, with its
+    inventory replaced by `num_items` items
+    """
+    save = BL3Save(template)
+    save.wipe_inventory()
+    serials = [datalib.BL3Serial.decode_serial_base64(code)
+            for code in itertools.islice(itertools.cycle(SERIALS), num_items)]
+    save.add_items(save.create_new_items(serials))
+    save.save_to(filename)
+
+def best_time(func, iterations):
+    """
+    Runs `func` `iterations` times, and returns the quickest run's time.
+    Garbage collection is turned off while timing, as `timeit` does, so that
+    collections triggered by earlier runs don't muddy things.
+    """
+    best = None
+    for _ in range(iterations):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark loading savegames with big backpacks',
+            )
+
+    parser.add_argument('-i', '--items',
+            type=int,
+            default=5000,
+            help='Number of items to put in the backpack',
+            )
+
+    parser.add_argument('-n', '--iterations',
+            type=int,
+            default=5,
+            help='Number of runs to take the best time from',
+            )
+
+    parser.add_argument('template',
+            help='Savegame to use as a template',
+            )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        filename = os.path.join(tempdir, 'backpack.sav')
+        out_filename = os.path.join(tempdir, 'out.sav')
+        make_backpack_save(args.template, filename, args.items)
+
+        def eager_wrap(save):
+            return [BL3Item(protobuf, save.datawrapper) for protobuf in save.save.inventory_items]
+
+        def rename_and_save(save):
+            save.set_char_name('Benchmark')
+            save.save_to(out_filename)
+
+        def touch_items(items):
+            for item in items:
+                item.level
+
+        def load_old():
+            save = BL3Save(filename)
+            return (save, eager_wrap(save))
+
+        def rename_and_save_old():
+            (save, _) = load_old()
+            rename_and_save(save)
+
+        # Make sure the lazy list hands back the same items as wrapping
+        # them all up front.
+        save = BL3Save(filename)
+        lazy_serials = [item.serial for item in save.get_items()]
+        eager_serials = [item.serial for item in eager_wrap(BL3Save(filename))]
+        if lazy_serials != eager_serials or len(lazy_serials) != args.items:
+            raise SystemExit('ERROR: lazy and eager item lists do not match')
+
+        print('{} items, best of {}:'.format(args.items, args.iterations))
+        for (label, func) in [
+                ('load', lambda: BL3Save(filename)),
+                ('load (old)', load_old),
+                ('load + rename + save', lambda: rename_and_save(BL3Save(filename))),
+                ('load + rename + save (old)', rename_and_save_old),
+                ('load + touch all items', lambda: touch_items(BL3Save(filename).get_items())),
+                ('load + touch all items (old)', lambda: touch_items(load_old()[1])),
+                ]:
+            print('  {:<30} {:8.1f}ms'.format(label, best_time(func, args.iterations)*1000))
+
+if __name__ == '__main__':
+    main()
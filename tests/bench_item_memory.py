@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Measures how much memory each of our item wrappers takes up, using
+# copies of the serials from `test_arbitrarybits`.  "Wrapped" is just after
+# creating the object (which includes decrypting its serial), and "parsed"
+# is after reading its level and parts.  The protobuf objects and serials
+# themselves are created before we start measuring, so they're not counted.
+# Run from the top level of the project with:
+#
+#     python -m tests.bench_item_memory
+
+import argparse
+import itertools
+import tracemalloc
+from bl3save import datalib
+from bl3save import OakSave_pb2
+from bl3save.bl3save import BL3Item, BL3EquipSlot
+from bl3save.bl3profile import BL3ProfItem
+from tests.test_arbitrarybits import SERIALS
+
+def measure(func):
+    """
+    Runs `func`, and returns a tuple of its result and the number of bytes
+    it left allocated
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (result, after - before)
+
+def parse_all(items):
+    """
+    Parses everything we can out of each of `items`
+    """
+    for item in items:
+        item.level
+        item.parts
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Measure the memory used by item wrappers',
+            )
+
+    parser.add_argument('-i', '--items',
+            type=int,
+            default=5000,
+            help='Number of items to create',
+            )
+
+    args = parser.parse_args()
+
+    datawrapper = datalib.get_default_datawrapper()
+    serials = [datalib.BL3Serial.decode_serial_base64(code)
+            for code in itertools.islice(itertools.cycle(SERIALS), args.items)]
+
+    # Get the databases loaded and their lookup caches filled before we
+    # start measuring, so that only the per-item cost gets counted.
+    parse_all([datalib.BL3Serial(serial, datawrapper) for serial in serials])
+
+    print('{} items (bytes per item):'.format(args.items))
+
+    # Profile items, which wrap the serials directly
+    container = list(serials)
+    (items, wrapped) = measure(lambda: [BL3ProfItem(serial, container, idx, datawrapper)
+        for (idx, serial) in enumerate(serials)])
+    (_, parsed) = measure(lambda: parse_all(items))
+    print('  {:<24} {:6d}'.format('BL3ProfItem, wrapped', wrapped//args.items))
+    print('  {:<24} {:6d}'.format('BL3ProfItem, parsed', (wrapped+parsed)//args.items))
+    del items
+
+    # Savegame items, which wrap an inventory protobuf
+    protobufs = [OakSave_pb2.OakInventoryItemSaveGameData(item_serial_number=serial) for serial in serials]
+    (items, wrapped) = measure(lambda: [BL3Item(protobuf, datawrapper) for protobuf in protobufs])
+    (_, parsed) = measure(lambda: parse_all(items))
+    print('  {:<24} {:6d}'.format('BL3Item, wrapped', wrapped//args.items))
+    print('  {:<24} {:6d}'.format('BL3Item, parsed', (wrapped+parsed)//args.items))
+    del items
+
+    # And equipment slots
+    protobufs = [OakSave_pb2.EquippedInventorySaveGameData(inventory_list_index=idx) for idx in range(args.items)]
+    (slots, wrapped) = measure(lambda: [BL3EquipSlot(protobuf) for protobuf in protobufs])
+    print('  {:<24} {:6d}'.format('BL3EquipSlot', wrapped//args.items))
+
+    print('(Each includes 8 bytes for its spot in the list holding them.)')
+
+if __name__ == '__main__':
+    main()
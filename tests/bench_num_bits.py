@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Microbenchmark for `InventorySerialDB.get_num_bits`.  The lookups used are
+# the ones which parsing (and re-serializing) the serials from
+# `test_arbitrarybits` asks for, so we get a realistic mix of categories and
+# versions.  Those get timed through the bit-width tables, for both the
+# binary and JSON DBs, and against walking the JSON DB's version lists the
+# way `get_num_bits` used to (`_find_num_bits`), checking that they all
+# agree.  Run from the top level of the project with:
+#
+#     python -m tests.bench_num_bits
+
+import time
+import argparse
+from bl3save import datalib
+from tests.test_arbitrarybits import SERIALS
+
+def record_lookups():
+    """
+    Parses and re-serializes all our test serials, and returns a list of
+    the `(category, version)` pairs that `get_num_bits` was called with
+    """
+    datawrapper = datalib.DataWrapper()
+    serial_db = datawrapper.serial_db
+    lookups = []
+    orig_get_num_bits = serial_db.get_num_bits
+    def get_num_bits(category, version):
+        lookups.append((category, version))
+        return orig_get_num_bits(category, version)
+    serial_db.get_num_bits = get_num_bits
+    for code in SERIALS:
+        item = datalib.BL3Serial(datalib.BL3Serial.decode_serial_base64(code), datawrapper)
+        item.parts
+        item.level = item.level
+    return lookups
+
+def time_lookups(func, lookups, iterations):
+    """
+    Runs `func` over all of `lookups` `iterations` times, and returns the
+    results of the last pass along with the average time per lookup
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        results = [func(category, version) for (category, version) in lookups]
+    elapsed = time.perf_counter() - start
+    return (results, elapsed/(iterations*len(lookups)))
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark serial DB bit-width lookups',
+            )
+
+    parser.add_argument('-n', '--iterations',
+            type=int,
+            default=2000,
+            help='Number of passes through the recorded lookups',
+            )
+
+    args = parser.parse_args()
+
+    lookups = record_lookups()
+    binary_db = datalib.InventorySerialDB()
+    json_db = datalib.InventorySerialDB(use_binary=False)
+    binary_db.get_num_bits(*lookups[0])
+    json_db.get_num_bits(*lookups[0])
+    if binary_db.bindb is None:
+        print('NOTE: the binary serial DB is not available')
+
+    print('{} lookups across {} categories, {} passes (time per lookup):'.format(
+        len(lookups),
+        len(set(category for (category, _) in lookups)),
+        args.iterations,
+        ))
+
+    (expected, elapsed) = time_lookups(json_db._find_num_bits, lookups, args.iterations)
+    print('  {:<28} {:8.1f}ns'.format('version list walk', elapsed*1e9))
+
+    failed = False
+    for (label, serial_db) in [
+            ('get_num_bits (binary DB)', binary_db),
+            ('get_num_bits (JSON DB)', json_db),
+            ]:
+        (results, elapsed) = time_lookups(serial_db.get_num_bits, lookups, args.iterations)
+        print('  {:<28} {:8.1f}ns'.format(label, elapsed*1e9))
+        if results != expected:
+            print('  ERROR: {} does not match the version list walk'.format(label))
+            failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Benchmark for `gvas.PayloadCodec`, timing both the NumPy and pure-int
+# paths against the original byte-at-a-time loop, and making sure they all
+# come up with the same output.  Run from the top level of the project with:
+#
+#     python -m tests.bench_payload_codec
+#
+# The reference loop is slow; 50MB takes a while.
+
+import os
+import time
+import argparse
+from bl3save import gvas
+from bl3save.bl3save import BL3Save
+
+def reference_decrypt(data, prefix_magic, xor_magic):
+    """
+    The original per-byte payload decryption loop
+    """
+    data = bytearray(data)
+    for i in range(len(data)-1, -1, -1):
+        if i < 32:
+            b = prefix_magic[i]
+        else:
+            b = data[i - 32]
+        b ^= xor_magic[i % 32]
+        data[i] ^= b
+    return data
+
+def reference_encrypt(data, prefix_magic, xor_magic):
+    """
+    The original per-byte payload encryption loop
+    """
+    data = bytearray(data)
+    for i in range(len(data)):
+        if i < 32:
+            b = prefix_magic[i]
+        else:
+            b = data[i - 32]
+        b ^= xor_magic[i % 32]
+        data[i] ^= b
+    return data
+
+def timed(func, *args):
+    """
+    Runs `func` with the given `args`, returning a tuple of the result and
+    the elapsed time
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return (result, time.perf_counter() - start)
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark savegame/profile payload encryption',
+            )
+
+    parser.add_argument('-s', '--sizes',
+            type=int,
+            nargs='+',
+            default=[1, 10, 50],
+            help='Payload sizes to test, in MB',
+            )
+
+    parser.add_argument('--no-reference',
+            action='store_true',
+            help="Don't time the original loop (output is then checked with a round trip instead)",
+            )
+
+    args = parser.parse_args()
+
+    codec = BL3Save._codec
+    numpy_module = gvas.numpy
+    if numpy_module is None:
+        print('NOTE: NumPy is not available; only timing the pure-int path')
+
+    failed = False
+    for size in args.sizes:
+        plain = os.urandom(size*1024*1024)
+        print('{}MB:'.format(size))
+
+        if args.no_reference:
+            ref_cipher = None
+        else:
+            (ref_cipher, elapsed) = timed(reference_encrypt, plain, codec.prefix_magic, codec.xor_magic)
+            print('  {:<12} encrypt {:8.3f}s'.format('reference', elapsed))
+            (ref_plain, elapsed) = timed(reference_decrypt, ref_cipher, codec.prefix_magic, codec.xor_magic)
+            print('  {:<12} decrypt {:8.3f}s'.format('reference', elapsed))
+            if ref_plain != plain:
+                print('  ERROR: reference loop did not round-trip')
+                failed = True
+
+        paths = [('pure-int', None)]
+        if numpy_module is not None:
+            paths.insert(0, ('numpy', numpy_module))
+        for (label, module) in paths:
+            gvas.numpy = module
+            try:
+                (cipher, enc_elapsed) = timed(codec.encrypt, plain)
+                (decrypted, dec_elapsed) = timed(codec.decrypt, cipher)
+            finally:
+                gvas.numpy = numpy_module
+            print('  {:<12} encrypt {:8.3f}s'.format(label, enc_elapsed))
+            print('  {:<12} decrypt {:8.3f}s'.format(label, dec_elapsed))
+            if ref_cipher is not None and cipher != ref_cipher:
+                print('  ERROR: {} encryption does not match the reference'.format(label))
+                failed = True
+            if decrypted != plain:
+                print('  ERROR: {} decryption does not match the original data'.format(label))
+                failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
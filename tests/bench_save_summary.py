@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Benchmark for `BL3Save.get_summary`, comparing reading the summary fields
+# straight out of the encrypted payload with a full decrypt-and-parse, and
+# making sure both come up with the same results.  This is what
+# `BL3Save.summary_scan_max_len` is based on.  Run from the top level of the
+# project with some savegames:
+#
+#     python -m tests.bench_save_summary 1.sav 2.sav ...
+#
+# Set PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=python to see how things look
+# with protobuf's pure-Python implementation.
+
+import os
+import time
+import argparse
+import tracemalloc
+from bl3save.bl3save import BL3Save
+from google.protobuf.internal import api_implementation
+
+def get_summary(filename, scan_max_len):
+    """
+    Opens `filename` lazily and returns its summary, using the wire scan for
+    payloads up to `scan_max_len` bytes (with `None` meaning no limit)
+    """
+    save = BL3Save(filename, lazy=True)
+    save.summary_scan_max_len = scan_max_len
+    return save.get_summary(True)
+
+def main():
+
+    parser = argparse.ArgumentParser(
+            description='Benchmark reading savegame summaries',
+            )
+
+    parser.add_argument('-n', '--iterations',
+            type=int,
+            default=10,
+            help='Number of times to read each file',
+            )
+
+    parser.add_argument('filenames',
+            nargs='+',
+            metavar='filename',
+            help='Savegames to test with',
+            )
+
+    args = parser.parse_args()
+
+    print('protobuf implementation: {}, current summary_scan_max_len: {}'.format(
+        api_implementation.Type(),
+        BL3Save.summary_scan_max_len,
+        ))
+
+    failed = False
+    for filename in args.filenames:
+        results = {}
+        for (label, scan_max_len) in [('scan', None), ('full parse', 0)]:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                summary = get_summary(filename, scan_max_len)
+            elapsed = (time.perf_counter() - start) / args.iterations
+
+            tracemalloc.start()
+            get_summary(filename, scan_max_len)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[label] = (summary, elapsed, peak)
+
+        print('{} ({} bytes):'.format(filename, os.path.getsize(filename)))
+        for (label, (summary, elapsed, peak)) in results.items():
+            print('  {:<12} {:8.2f}ms  {:8d}KB peak'.format(label, elapsed*1000, peak//1024))
+        if results['scan'][0] != results['full parse'][0]:
+            print('  ERROR: summaries do not match')
+            failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
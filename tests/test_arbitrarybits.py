@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Checks `datalib.ArbitraryBits` against the original string-based
+# implementation (kept below as `StringBits`), and makes sure that item
+# serials survive a trip through `_parse_serial` and `_deparse_serial`
+# byte-for-byte.  Run from the top level of the project with either:
+#
+#     python -m unittest discover tests
+#     python -m pytest tests
+
+import random
+import struct
+import unittest
+from bl3save import datalib
+
+# A spread of real item serials: v3 and v4 serials, with and without
+# generic parts (anointments/Mayhem), with and without an obfuscation seed,
+# and with both current and older serial DB versions.
+SERIALS = [
+        'BL3(AwAAMDnxT7K0q6UTSYd9PuI6HuQJ39S+kd0=)',
+        'BL3(A//+fjOVMcGpLEKXTP5jxM/TYFjzTodPkyc=)',
+        'BL3(A//+fjOJcpcloSv+aeW645RSLhlurRSPRQ==)',
+        'BL3(AzByx8LOAgkqxT6k2iEYMRiF793Pj7c=)',
+        'BL3(AwAAAADTmoC+y5RBQSxoak/UDQAA)',
+        'BL3(AwAAAADjwYC+/VTAElRwYEOdCRzMKYrYIWAVAA==)',
+        'BL3(AwAAAAAJC4Cd7eigfApWyB/SWdglg8CSLAA=)',
+        'BL3(AwAAAADmlYAiVOdwPMPBjSkE0AA=)',
+        'BL3(AwAAMDk4w7JVnqVlceKYt6sdRw==)',
+        'BL3(A7gWiATztTQlGTUasX7IHNDXbqQe/wQQeFILHRU=)',
+        'BL3(AwAAMDmes6sSL05Cm0LZ0qJfBZ6xdbAc)',
+        'BL3(AwAAMDnBS5uEmwUCnZIYP4tyKdaM692FkKTmdYE=)',
+        'BL3(AwAAAACYn4A+x1PBQigsarCMnnQRNsMAewA=)',
+        'BL3(AwAAAAB+f4C+6MABIhlA8V6CKiAUAA==)',
+        'BL3(AwAAAACm1ICueySAIS6HONolrJC/0QUPAAA=)',
+        'BL3(AwAAAAA7coAyAdZgoSHhfZggiXnIBNEEAA==)',
+        'BL3(BAAAMDm+G7MmQdJaToHYJ6JX)',
+        'BL3(BAAAMDmwz7I1nKVlUVxYVqZ/ZQ==)',
+        'BL3(BP/+fjMvEZagtGxN4b1jXF9oZA==)',
+        'BL3(BP/+fjPfyJ+Ey8w9lPvM5NKb/zKPd54P)',
+        'BL3(BAAAAAAUQIC+3bhBsBoIzggEOEAA)',
+        'BL3(BAAAAAAIF4C+QrOA4StqNeYwAwBQAA==)',
+        'BL3(BAAAAACCcICi0hewPAAE3IAA)',
+        'BL3(BAAAAAAmJoCtJuzgWDGfkhh5p0yqB2MfFoAg0AgDAg==)',
+        'BL3(BAAAMDnu6NLW/+XbbsZYmaCU5H4p)',
+        'BL3(BI3L/pqikAtXzNAFqXsirhrftbZSVblq9iM2H0s=)',
+        'BL3(BAAAMDm+Woom5Ahj/yxZQKbf)',
+        'BL3(BAAAMDn9yoKof6/MEzG4J/mBWDk2T0EsXAdJfoDuyW8=)',
+        'BL3(BAAAAADnfYA+86yBUUwyK0lRNAMt6VERwM6CAg==)',
+        'BL3(BAAAAADBAYC+HSDBMhGc6AJJAPYcBgA=)',
+        'BL3(BAAAAADhQoAwO4zAuB2fU4GBuoZB4P8MCAA=)',
+        'BL3(BAAAAABZRYAfdqSAfoPJCeIAIAA=)',
+        ]
+
+class StringBits(object):
+    """
+    The original string-based ArbitraryBits implementation, which stores the
+    data as a string of `0` and `1` characters (in backwards chunks of 8
+    bits).  Kept around purely as a reference for what the real thing should
+    be doing.  Note that `append_data` takes the `data` string from another
+    StringBits object, rather than the object itself.
+    """
+
+    def __init__(self, data=b''):
+        self.data = ''.join([f'{d:08b}' for d in reversed(data)])
+
+    def eat(self, bits):
+        if bits > len(self.data):
+            raise Exception('Attempted to read {} bits, but only {} remain'.format(bits, len(self.data)))
+        val = int(self.data[-bits:], 2)
+        self.data = self.data[:-bits]
+        return val
+
+    def append_value(self, value, bits):
+        value_data = struct.pack('>I', value)
+        value_txt = ''.join([f'{d:08b}' for d in value_data])
+        self.data = value_txt[-bits:] + self.data
+
+    def append_data(self, new_data):
+        self.data = new_data + self.data
+
+    def get_data(self):
+        need_bits = (8-len(self.data)) % 8
+        temp_data = '0'*need_bits + self.data
+        byte_data = []
+        for i in range(int(len(temp_data)/8)-1, -1, -1):
+            byte_data.append(int(temp_data[i*8:(i*8)+8], 2))
+        return bytearray(byte_data)
+
+def string_parse(serial_db, data, serial_version, part_invkey):
+    """
+    Reads the serial `data` (already decrypted) with StringBits, the same way
+    `BL3Serial._parse_serial` does.  Returns a tuple containing the header
+    values (version, balance, inventory data, manufacturer and level indexes),
+    the StringBits data left after the header, and a tuple of the part
+    indexes, generic part indexes, additional data, customization count and
+    reroll count.
+    """
+    bits = StringBits(data)
+    assert(bits.eat(8) == 128)
+    version = bits.eat(7)
+    header = [version]
+    for category in ['InventoryBalanceData', 'InventoryData', 'ManufacturerData']:
+        header.append(bits.eat(serial_db.get_num_bits(category, version)))
+    header.append(bits.eat(7))
+    remaining = bits.data
+
+    part_bits = serial_db.get_num_bits(part_invkey, version)
+    parts = [bits.eat(part_bits) for _ in range(bits.eat(6))]
+    generic_bits = serial_db.get_num_bits('InventoryGenericPartData', version)
+    generics = [bits.eat(generic_bits) for _ in range(bits.eat(4))]
+    additional = [bits.eat(8) for _ in range(bits.eat(8))]
+    num_customs = bits.eat(4)
+    if serial_version >= 4:
+        rerolled = bits.eat(8)
+    else:
+        rerolled = 0
+    return (header, remaining, (parts, generics, additional, num_customs, rerolled))
+
+def item_fields(item):
+    """
+    Returns everything we know about the parsed `item`, for comparisons
+    """
+    return (item._version,
+            item._balance, item._balance_idx, item._balance_bits,
+            item._invdata, item._invdata_idx, item._invdata_bits,
+            item._manufacturer, item._manufacturer_idx, item._manufacturer_bits,
+            item._level,
+            item._part_invkey, item._part_bits, item._parts,
+            item._generic_bits, item._generic_parts,
+            item._additional_data, item._num_customs, item._rerolled,
+            item.can_parse_parts, item.parts_parsed,
+            )
+
+class ArbitraryBitsTests(unittest.TestCase):
+    """
+    Runs random sequences of operations through both ArbitraryBits and
+    StringBits, and makes sure that they always agree.
+    """
+
+    def setUp(self):
+        self.rng = random.Random(1234)
+
+    def random_data(self, max_len=40):
+        return bytes(self.rng.getrandbits(8) for _ in range(self.rng.randrange(max_len)))
+
+    def assertSameBits(self, bits, ref):
+        self.assertEqual(len(bits), len(ref.data))
+        self.assertEqual(bits.get_data(), ref.get_data())
+
+    def test_init(self):
+        for _ in range(200):
+            data = self.random_data()
+            self.assertSameBits(datalib.ArbitraryBits(data), StringBits(data))
+
+    def test_eat(self):
+        for _ in range(200):
+            data = self.random_data()
+            bits = datalib.ArbitraryBits(data)
+            ref = StringBits(data)
+            while len(ref.data) > 0:
+                num_bits = self.rng.randint(1, min(32, len(ref.data)))
+                self.assertEqual(bits.eat(num_bits), ref.eat(num_bits))
+                self.assertSameBits(bits, ref)
+
+    def test_eat_too_much(self):
+        for data in [b'', b'\x01', b'\xff\x00\xff']:
+            bits = datalib.ArbitraryBits(data)
+            ref = StringBits(data)
+            with self.assertRaises(Exception) as bits_cm:
+                bits.eat(len(data)*8+1)
+            with self.assertRaises(Exception) as ref_cm:
+                ref.eat(len(data)*8+1)
+            self.assertEqual(str(bits_cm.exception), str(ref_cm.exception))
+            self.assertSameBits(bits, ref)
+
+    def test_append_value(self):
+        for _ in range(200):
+            data = self.random_data()
+            bits = datalib.ArbitraryBits(data)
+            ref = StringBits(data)
+            for _ in range(self.rng.randrange(20)):
+                # Values can be wider than the number of bits they're
+                # stored in, and those extra bits should get dropped.
+                value = self.rng.getrandbits(32)
+                num_bits = self.rng.randint(1, 36)
+                bits.append_value(value, num_bits)
+                ref.append_value(value, num_bits)
+                self.assertSameBits(bits, ref)
+
+    def test_append_data(self):
+        for _ in range(200):
+            data = self.random_data()
+            new_data = self.random_data()
+            bits = datalib.ArbitraryBits(data)
+            ref = StringBits(data)
+            new_bits = datalib.ArbitraryBits(new_data)
+            new_ref = StringBits(new_data)
+
+            # Knock a few bits off the front of each, so we're not always
+            # appending whole bytes.
+            for (b, r) in [(bits, ref), (new_bits, new_ref)]:
+                if len(r.data) > 0:
+                    num_bits = self.rng.randint(1, min(7, len(r.data)))
+                    self.assertEqual(b.eat(num_bits), r.eat(num_bits))
+
+            bits.append_data(new_bits)
+            ref.append_data(new_ref.data)
+            self.assertSameBits(bits, ref)
+            self.assertSameBits(new_bits, new_ref)
+
+    def test_mixed(self):
+        for _ in range(200):
+            data = self.random_data()
+            bits = datalib.ArbitraryBits(data)
+            ref = StringBits(data)
+            for _ in range(30):
+                op = self.rng.randrange(3)
+                if op == 0 and len(ref.data) > 0:
+                    num_bits = self.rng.randint(1, min(32, len(ref.data)))
+                    self.assertEqual(bits.eat(num_bits), ref.eat(num_bits))
+                elif op == 1:
+                    value = self.rng.getrandbits(self.rng.randint(1, 32))
+                    num_bits = self.rng.randint(1, 32)
+                    bits.append_value(value, num_bits)
+                    ref.append_value(value, num_bits)
+                else:
+                    new_data = self.random_data(8)
+                    bits.append_data(datalib.ArbitraryBits(new_data))
+                    ref.append_data(StringBits(new_data).data)
+                self.assertSameBits(bits, ref)
+
+    def test_copy(self):
+        data = self.random_data()
+        bits = datalib.ArbitraryBits(data)
+        copy = bits.copy()
+        copy.append_value(5, 3)
+        self.assertEqual(bits.get_data(), bytearray(data))
+        self.assertEqual(len(copy), len(data)*8+3)
+
+class SerialRoundTripTests(unittest.TestCase):
+    """
+    Parses and re-encodes real item serials, comparing the results against
+    what StringBits comes up with.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.datawrapper = datalib.get_default_datawrapper()
+        cls.serial_db = cls.datawrapper.serial_db
+
+    def get_item(self, code):
+        item = datalib.BL3Serial(datalib.BL3Serial.decode_serial_base64(code), self.datawrapper)
+        item._parse_serial()
+        self.assertTrue(item.parts_parsed)
+        return item
+
+    def assertMatchesFreshParse(self, item):
+        fresh = datalib.BL3Serial(item.serial, self.datawrapper)
+        fresh._parse_serial()
+        self.assertEqual(fresh.decrypted_serial, item.decrypted_serial)
+        self.assertEqual(item_fields(fresh), item_fields(item))
+
+    def test_parse(self):
+        for code in SERIALS:
+            with self.subTest(code=code):
+                item = self.get_item(code)
+                (header, remaining, parts) = string_parse(self.serial_db,
+                        item.decrypted_serial, item.serial_version, item._part_invkey)
+                self.assertEqual(header, [item._version, item._balance_idx,
+                    item._invdata_idx, item._manufacturer_idx, item._level])
+                self.assertEqual(parts, (
+                    [idx for (_, idx) in item._parts],
+                    [idx for (_, idx) in item._generic_parts],
+                    item._additional_data,
+                    item._num_customs,
+                    item._rerolled,
+                    ))
+
+    def test_reencode_unchanged(self):
+        for code in SERIALS:
+            with self.subTest(code=code):
+                item = self.get_item(code)
+                orig_data = bytes(item.decrypted_serial)
+                item.level = item.level
+                self.assertEqual(bytes(item.decrypted_serial), orig_data)
+                self.assertEqual(item.serial,
+                        datalib.BL3Serial._encrypt_serial(orig_data, item.serial_version, 0))
+                self.assertMatchesFreshParse(item)
+
+    def test_reencode_level(self):
+        for code in SERIALS:
+            with self.subTest(code=code):
+                item = self.get_item(code)
+                (header, remaining, _) = string_parse(self.serial_db,
+                        item.decrypted_serial, item.serial_version, item._part_invkey)
+                new_level = 1 if item.level == 72 else 72
+                item.level = new_level
+
+                # Only the level has changed, so the rest of the serial
+                # should be carried over exactly.
+                ref = StringBits()
+                ref.append_value(128, 8)
+                ref.append_value(header[0], 7)
+                ref.append_value(header[1], item._balance_bits)
+                ref.append_value(header[2], item._invdata_bits)
+                ref.append_value(header[3], item._manufacturer_bits)
+                ref.append_value(new_level, 7)
+                ref.append_data(remaining)
+                self.assertEqual(item.decrypted_serial, ref.get_data())
+                self.assertMatchesFreshParse(item)
+
+    def test_reencode_parts(self):
+        mayhem_count = 0
+        for code in SERIALS:
+            item = self.get_item(code)
+            if not item.can_have_mayhem():
+                continue
+            mayhem_count += 1
+            with self.subTest(code=code):
+                item.mayhem_level = 4 if item.mayhem_level != 4 else 10
+
+                # Changing parts re-writes the whole serial, using the
+                # latest serial DB version.
+                version = self.serial_db.max_version
+                ref = StringBits()
+                ref.append_value(128, 8)
+                ref.append_value(version, 7)
+                for (category, value) in [
+                        ('InventoryBalanceData', item._balance_idx),
+                        ('InventoryData', item._invdata_idx),
+                        ('ManufacturerData', item._manufacturer_idx),
+                        ]:
+                    ref.append_value(value, self.serial_db.get_num_bits(category, version))
+                ref.append_value(item._level, 7)
+                ref.append_value(len(item._parts), 6)
+                part_bits = self.serial_db.get_num_bits(item._part_invkey, version)
+                for (_, idx) in item._parts:
+                    ref.append_value(idx, part_bits)
+                ref.append_value(len(item._generic_parts), 4)
+                generic_bits = self.serial_db.get_num_bits('InventoryGenericPartData', version)
+                for (_, idx) in item._generic_parts:
+                    ref.append_value(idx, generic_bits)
+                ref.append_value(len(item._additional_data), 8)
+                for value in item._additional_data:
+                    ref.append_value(value, 8)
+                ref.append_value(item._num_customs, 4)
+                if item.serial_version >= 4:
+                    ref.append_value(item._rerolled, 8)
+                self.assertEqual(item.decrypted_serial, ref.get_data())
+                self.assertMatchesFreshParse(item)
+        self.assertGreater(mayhem_count, 0)
+
+    def test_adopt_parsed(self):
+        for code in SERIALS:
+            with self.subTest(code=code):
+                source = self.get_item(code)
+                item = datalib.BL3Serial(source.serial, self.datawrapper, source)
+                self.assertTrue(item.parts_parsed)
+                self.assertEqual(item_fields(item), item_fields(source))
+
+                # Editing one shouldn't affect the other
+                new_level = 1 if item.level == 72 else 72
+                item.level = new_level
+                if item.can_have_mayhem():
+                    item.mayhem_level = 4 if item.mayhem_level != 4 else 10
+                self.assertMatchesFreshParse(item)
+                self.assertMatchesFreshParse(source)
+                self.assertEqual(item.level, new_level)
+                self.assertNotEqual(source.level, new_level)
+
+if __name__ == '__main__':
+    unittest.main()
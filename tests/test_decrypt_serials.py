@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Checks that the batch `datalib.decrypt_serials` agrees with decrypting
+# serials one at a time.  The NumPy path only kicks in for batches of 16 or
+# more, so the batches here are all at least that big.
+
+import binascii
+import unittest
+from bl3save import datalib
+from tests.test_arbitrarybits import SERIALS
+
+class DecryptSerialsTests(unittest.TestCase):
+
+    def decrypt_one(self, serial):
+        try:
+            return datalib.BL3Serial._decrypt_serial(serial)
+        except Exception:
+            return None
+
+    def test_matches_single(self):
+        serials = [datalib.BL3Serial.decode_serial_base64(code) for code in SERIALS]
+        # Throw in some broken ones, too
+        serials.append(serials[0][:-1])
+        serials.append(b'\x05' + serials[1][1:])
+        serials.append(b'\x03\x00\x00')
+        self.assertEqual(datalib.decrypt_serials(serials),
+                [self.decrypt_one(serial) for serial in serials])
+
+    def test_too_short(self):
+        # Serials with just a single byte after the header can't hold a CRC.
+        # Pair them up so that each one's payload byte plus the next one's
+        # makes up the correct CRC, which a batch decrypt reading past the
+        # end of each row would accept.
+        header = bytes([3, 0, 0, 0, 0])
+        crc = binascii.crc32(b'\xFF\xFF', binascii.crc32(header))
+        crc = ((crc >> 16) ^ crc) & 0xFFFF
+        serials = [header + bytes([crc >> 8]), header + bytes([crc & 0xFF])]*10
+        self.assertEqual(datalib.decrypt_serials(serials), [None]*len(serials))
+        with self.assertRaises(Exception):
+            datalib.BL3Serial._decrypt_serial(serials[0])
+
+if __name__ == '__main__':
+    unittest.main()
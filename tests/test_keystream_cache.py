@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Checks that `datalib.KeystreamCache` hands back the right keystreams and
+# keeps its counters straight when it's being hammered from several threads
+# at once.  The cache is kept small so that seeds are constantly getting
+# evicted out from under other threads.
+
+import time
+import threading
+import unittest
+import collections
+from bl3save import datalib
+
+class YieldingDict(collections.OrderedDict):
+    """
+    OrderedDict which gives other threads a chance to run right after each
+    lookup, which is where the cache is most likely to get tripped up if
+    it's not properly locked.
+    """
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        time.sleep(0)
+        return value
+
+class KeystreamCacheTests(unittest.TestCase):
+
+    def test_threaded(self):
+        seeds = list(range(-40, 40, 3))
+        lengths = [8, 40, 20]
+        expected = {}
+        for seed in seeds:
+            for length in lengths:
+                expected[(seed, length)] = datalib.KeystreamCache().get(seed, length)[:length]
+
+        cache = datalib.KeystreamCache(max_seeds=4)
+        cache.streams = YieldingDict()
+        num_threads = 8
+        passes = 20
+        errors = []
+        def worker(offset):
+            try:
+                for idx in range(passes):
+                    for seed in seeds[offset:] + seeds[:offset]:
+                        length = lengths[(seed + idx) % len(lengths)]
+                        if cache.get(seed, length)[:length] != expected[(seed, length)]:
+                            errors.append((seed, length))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(offset,)) for offset in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.hits + cache.misses, num_threads*passes*len(seeds))
+        self.assertLessEqual(len(cache.streams), cache.max_seeds)
+
+    def test_clear(self):
+        cache = datalib.KeystreamCache()
+        cache.get(10, 8)
+        cache.get(10, 8)
+        cache.clear()
+        self.assertEqual((cache.hits, cache.misses, len(cache.streams)), (0, 0, 0))
+
+if __name__ == '__main__':
+    unittest.main()
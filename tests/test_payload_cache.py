@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# vim: set expandtab tabstop=4 shiftwidth=4:
+
+# Copyright (c) 2020-2021 CJ Kucera (cj@apocalyptech.com)
+#
+# This software is provided 'as-is', without any express or implied warranty.
+# In no event will the authors be held liable for any damages arising from
+# the use of this software.
+#
+# Permission is granted to anyone to use this software for any purpose,
+# including commercial applications, and to alter it and redistribute it
+# freely, subject to the following restrictions:
+#
+# 1. The origin of this software must not be misrepresented; you must not
+#    claim that you wrote the original software. If you use this software in a
+#    product, an acknowledgment in the product documentation would be
+#    appreciated but is not required.
+#
+# 2. Altered source versions must be plainly marked as such, and must not be
+#    misrepresented as being the original software.
+#
+# 3. This notice may not be removed or altered from any source distribution.
+
+# Checks that `cache.PayloadCache` stays within its size limit, evicting the
+# least-recently-used entries, even though it only keeps a running total of
+# its size rather than looking at every entry each time.
+
+import os
+import tempfile
+import unittest
+from bl3save.cache import PayloadCache
+
+class PayloadCacheTests(unittest.TestCase):
+
+    entry_size = 1000
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = PayloadCache(self.tempdir.name, max_size=self.entry_size*10)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def put(self, idx):
+        # Filesystem timestamps can be fairly coarse, so give each entry an
+        # mtime of its own, well in the past.
+        key = 'key{}'.format(idx)
+        self.cache.put(key, bytes([idx])*self.entry_size)
+        mtime = 1000000000000000000 + idx
+        os.utime(self.cache._path(key), ns=(mtime, mtime))
+
+    def keys(self):
+        return sorted(os.path.basename(path)[:-len(self.cache.suffix)]
+                for _, _, path in self.cache._entries())
+
+    def test_evict(self):
+        for idx in range(10):
+            self.put(idx)
+        self.assertEqual(len(self.keys()), 10)
+
+        # Using key0 should save it from being evicted; going over the limit
+        # then clears out the oldest entries until we're down to 90%.
+        self.assertEqual(self.cache.get('key0', self.entry_size), bytes([0])*self.entry_size)
+        self.put(10)
+        self.assertEqual(self.keys(), ['key0', 'key10'] + ['key{}'.format(idx) for idx in range(3, 10)])
+
+        for idx in range(11, 100):
+            self.put(idx)
+            self.assertLessEqual(len(self.keys()), 10)
+
+    def test_existing_entries(self):
+        # A new cache object should account for what's already on disk
+        for idx in range(10):
+            self.put(idx)
+        self.cache = PayloadCache(self.tempdir.name, max_size=self.entry_size*10)
+        self.put(10)
+        self.assertEqual(len(self.keys()), 9)
+
+    def test_clear(self):
+        for idx in range(5):
+            self.put(idx)
+        self.assertEqual(self.cache.clear(), 5)
+        for idx in range(10):
+            self.put(idx)
+        self.assertEqual(len(self.keys()), 10)
+
+if __name__ == '__main__':
+    unittest.main()